@@ -0,0 +1,92 @@
+"""AI 审计日志缓冲写入模块
+
+工具调用的审计日志不再逐条 commit，而是先放入内存队列，
+由后台线程按数量/时间阈值批量写入数据库。
+"""
+import atexit
+import queue
+import threading
+import time
+from typing import Any
+
+from loguru import logger
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import sessionmaker
+
+from app.models.ai_audit_log import AIAuditLog
+
+
+class AuditLogBuffer:
+    """审计日志缓冲区（每个数据库 Engine 一个实例）"""
+
+    BUFFER_SIZE = 100  # 单批最多写入条数
+    FLUSH_INTERVAL = 1.0  # 最长刷新间隔（秒）
+    QUEUE_MAXSIZE = 10000  # 队列上限，超出后丢弃并告警
+
+    def __init__(self, engine: Engine):
+        self._session_factory = sessionmaker(bind=engine)
+        self._queue: queue.Queue[dict[str, Any]] = queue.Queue(maxsize=self.QUEUE_MAXSIZE)
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="ai-audit-log-writer", daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def put(self, entry: dict[str, Any]) -> None:
+        """放入一条审计日志（不阻塞调用方）"""
+        try:
+            self._queue.put_nowait(entry)
+        except queue.Full:
+            logger.warning(f"审计日志队列已满，丢弃记录: {entry.get('tool_name')}")
+
+    def close(self) -> None:
+        """停止后台线程，并写入队列中剩余的日志"""
+        self._stop.set()
+        self._thread.join(timeout=5)
+
+    def _run(self) -> None:
+        while not (self._stop.is_set() and self._queue.empty()):
+            batch = self._drain()
+            if batch:
+                self._write(batch)
+
+    def _drain(self) -> list[dict[str, Any]]:
+        """等待首条日志，然后在刷新间隔内尽量凑满一批"""
+        try:
+            batch = [self._queue.get(timeout=self.FLUSH_INTERVAL)]
+        except queue.Empty:
+            return []
+
+        deadline = time.monotonic() + self.FLUSH_INTERVAL
+        while len(batch) < self.BUFFER_SIZE:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _write(self, batch: list[dict[str, Any]]) -> None:
+        try:
+            with self._session_factory() as session:
+                session.bulk_insert_mappings(AIAuditLog, batch)
+                session.commit()
+            logger.debug(f"审计日志批量写入 {len(batch)} 条")
+        except Exception as e:
+            logger.error(f"审计日志批量写入失败（{len(batch)} 条）: {e}", exc_info=True)
+
+
+_buffers: dict[Engine, AuditLogBuffer] = {}
+_buffers_lock = threading.Lock()
+
+
+def get_audit_buffer(engine: Engine) -> AuditLogBuffer:
+    """获取指定 Engine 对应的审计日志缓冲区（懒创建）"""
+    buffer = _buffers.get(engine)
+    if buffer is None:
+        with _buffers_lock:
+            buffer = _buffers.get(engine)
+            if buffer is None:
+                buffer = _buffers[engine] = AuditLogBuffer(engine)
+    return buffer
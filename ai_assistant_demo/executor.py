@@ -1,9 +1,34 @@
 """AI 助手工具执行器模块"""
+import re
 import time
+from datetime import UTC, datetime
+from collections import Counter, defaultdict
+from collections.abc import Callable, Iterable
+from itertools import islice
+from types import SimpleNamespace
 from typing import Any
 
 from loguru import logger
-from sqlalchemy.orm import Session
+from sqlalchemy import (
+    Date,
+    DateTime,
+    Time,
+    bindparam,
+    case,
+    cast,
+    exists,
+    func,
+    insert,
+    select,
+    text,
+    true,
+    tuple_,
+    update,
+)
+from sqlalchemy.dialects.postgresql import JSONB
+from sqlalchemy.engine import Engine
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session, raiseload, selectinload
 
 from app.models.rule import RuleConfig
 from app.models.proxy_group import ProxyGroupConfig
@@ -16,7 +41,215 @@ from app.models.wireguard import WireGuardConfig
 from app.models.wireguard_peer_service import WireGuardPeerService
 from app.models.rule_set import RuleSet, RuleSetItem
 from app.models.device import Device
-from app.utils.transaction import with_transaction
+from .audit_buffer import get_audit_buffer
+
+_MISSING = object()
+
+# 单调时钟（纳秒整数），用于统计工具执行耗时
+_now = time.perf_counter_ns
+
+# 只读工具：不修改任何配置，执行成功时无需写审计日志
+# （execute_sql 即使是查询也保留审计）
+_READ_ONLY_TOOLS = frozenset({
+    "list_rules",
+    "list_proxy_groups",
+    "list_proxies",
+    "list_hosts",
+    "list_general_configs",
+    "get_config_summary",
+    "list_wireguard_peer_services",
+    "list_wireguard_configs",
+    "list_config_history",
+    "list_rulesets",
+    "get_ruleset",
+    "list_devices",
+})
+
+# 列表查询是否禁止隐式懒加载：开启后在列表结果上意外访问关系属性会直接抛错，
+# 以便尽早发现 N+1 查询；生产环境如需容错可关闭
+STRICT_LIST_LOADING = True
+
+
+def _list_load_options(*options: Any) -> tuple[Any, ...]:
+    """列表查询的加载选项：显式预加载所需关系，其余关系按开关禁止懒加载"""
+    if STRICT_LIST_LOADING:
+        return (*options, raiseload("*"))
+    return options
+
+
+# 模型列缓存：{模型类: ((列名, 是否日期/时间列), ...)}
+_COLUMN_CACHE: dict[type, tuple[tuple[str, bool], ...]] = {}
+
+
+def _columns_of(model_class: type) -> tuple[tuple[str, bool], ...]:
+    """获取模型的列名及是否为日期/时间列（按模型类缓存）"""
+    columns = _COLUMN_CACHE.get(model_class)
+    if columns is None:
+        columns = _COLUMN_CACHE[model_class] = tuple(
+            (column.name, isinstance(column.type, (Date, DateTime, Time)))
+            for column in model_class.__table__.columns
+        )
+    return columns
+
+
+# 记录版本的资源类型与模型的对应关系（回滚时按 resource_type 查找模型）
+_VERSIONED_MODELS: dict[str, type] = {
+    "rule": RuleConfig,
+    "proxy": ProxyConfig,
+    "proxy_group": ProxyGroupConfig,
+    "host": HostConfig,
+    "general_config": GeneralConfig,
+    "wireguard_config": WireGuardConfig,
+    "wireguard_peer_service": WireGuardPeerService,
+}
+
+# 模块加载时预先计算列信息，版本记录路径上不再触发表结构遍历
+for _model_class in _VERSIONED_MODELS.values():
+    _columns_of(_model_class)
+
+
+# ============ 全局配置过滤条件 ============
+# device_id 为空表示全局配置；条件对象只构建一次，各查询直接复用
+
+_RULE_GLOBAL_FILTER = RuleConfig.device_id.is_(None)
+_PROXY_GLOBAL_FILTER = ProxyConfig.device_id.is_(None)
+_HOST_GLOBAL_FILTER = HostConfig.device_id.is_(None)
+_GEN_GLOBAL_FILTER = GeneralConfig.device_id.is_(None)
+_GROUP_GLOBAL_FILTER = ProxyGroupConfig.device_id.is_(None)
+_WG_GLOBAL_FILTER = WireGuardConfig.device_id.is_(None)
+
+# ============ 预构建的查询语句 ============
+# 语句对象在模块加载时构建一次，执行时只绑定参数，可直接命中 SQLAlchemy 的编译缓存
+
+_RULE_BY_ID = select(RuleConfig).where(RuleConfig.id == bindparam("id"), _RULE_GLOBAL_FILTER)
+_PROXY_BY_ID = select(ProxyConfig).where(ProxyConfig.id == bindparam("id"), _PROXY_GLOBAL_FILTER)
+_PROXY_GROUP_BY_ID = select(ProxyGroupConfig).where(
+    ProxyGroupConfig.id == bindparam("id"), _GROUP_GLOBAL_FILTER
+)
+_HOST_BY_ID = select(HostConfig).where(HostConfig.id == bindparam("id"), _HOST_GLOBAL_FILTER)
+_WG_CONFIG_BY_ID = select(WireGuardConfig).where(WireGuardConfig.id == bindparam("id"), _WG_GLOBAL_FILTER)
+_WG_PEER_SERVICE_BY_ID = select(WireGuardPeerService).where(WireGuardPeerService.id == bindparam("id"))
+
+# WireGuard 更新处理器可修改的字段：(属性名, 显示名称)
+_WG_PEER_FIELDS = (
+    ("public_key", "公钥"),
+    ("endpoint", "端点"),
+    ("allowed_ips", "允许 IP"),
+    ("preshared_key", "预共享密钥"),
+    ("keepalive", "保持连接"),
+    ("description", "描述"),
+)
+_WG_CONFIG_FIELDS = (
+    ("private_key", "私钥"),
+    ("self_ip", "本地 IP"),
+    ("self_ip_v6", "本地 IPv6"),
+    ("dns_server", "DNS"),
+    ("mtu", "MTU"),
+    ("description", "描述"),
+)
+
+# 审计日志中 message / 字符串参数的最大长度
+_AUDIT_TEXT_LIMIT = 512
+
+
+def _audit_trim_arguments(arguments: dict[str, Any]) -> dict[str, Any]:
+    """压缩写入审计日志的工具参数：截断过长的字符串参数"""
+    return {
+        k: v[:_AUDIT_TEXT_LIMIT] if isinstance(v, str) else v
+        for k, v in arguments.items()
+    }
+
+
+def _audit_trim_result(result: dict[str, Any]) -> dict[str, Any]:
+    """压缩写入审计日志的工具结果
+
+    完整结果只返回给调用方；审计日志中 message 截断，列表数据只记录条数，
+    字典数据只保留标量字段（嵌套的列表/字典记录为条数）。
+    """
+    trimmed = {
+        "success": result.get("success", False),
+        "message": (result.get("message") or "")[:_AUDIT_TEXT_LIMIT],
+    }
+    data = result.get("data")
+    if isinstance(data, list):
+        trimmed["data_count"] = len(data)
+    elif isinstance(data, dict):
+        trimmed["data"] = {
+            k: len(v) if isinstance(v, (list, dict)) else v
+            for k, v in data.items()
+        }
+    return trimmed
+
+
+def _truncate(value: str | None, limit: int) -> str | None:
+    """截断过长的文本用于预览"""
+    return value[:limit] + "..." if len(value or "") > limit else value
+
+
+def _keyword_pattern(keyword: str) -> str:
+    """把搜索关键词转换为 LIKE 模式（配合 escape="\\" 使用）
+
+    仅首尾的 * 作为锚点：如 "google*" → "google%"（前缀匹配可走 B-tree 索引），
+    "*.google.com" → "%.google.com"；不含首尾 * 时保持原有的包含匹配。
+    其余位置的 %、_、* 都按字面字符匹配。
+    """
+    prefix = "%" if keyword.startswith("*") else ""
+    suffix = "%" if keyword.endswith("*") else ""
+    if not prefix and not suffix:
+        prefix = suffix = "%"
+    core = keyword[1:] if keyword.startswith("*") else keyword
+    core = core[:-1] if keyword.endswith("*") and core else core
+    escaped = core.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+    return f"{prefix}{escaped}{suffix}"
+
+
+def _render_blocks(header: str, blocks: Iterable[str]) -> str:
+    """拼接列表消息：标题 + 空行分隔的条目块（与逐行 append 后 join 的格式一致）"""
+    return header + "\n\n" + "\n\n".join(blocks) + "\n"
+
+
+# 配置概览中最多展示的建议条数（凑满后不再执行后续检测）
+_SUGGESTION_LIMIT = 5
+
+
+def _build_suggestions(
+    all_rules: list, used_policies: set[str], groups: list, load_unused_proxies: Callable[[], list[str]]
+) -> list[str]:
+    """AI 配置建议检测（冗余规则、未使用的代理组/节点、FINAL 规则顺序）"""
+    suggestions = []
+
+    # 检测 1: 冗余规则（相同的 rule_type + value + policy，以元组为键，避免逐条拼接字符串）
+    rule_signatures = defaultdict(list)
+    for r in all_rules:
+        rule_signatures[(r.rule_type, r.value, r.policy)].append(r.id)
+
+    # 只取前 3 组重复，找到后即停止扫描
+    duplicates = islice((ids for ids in rule_signatures.values() if len(ids) > 1), 3)
+    for ids in duplicates:
+        suggestions.append(f"⚠️ 冗余规则：规则 {', '.join([f'#{id}' for id in ids])} 完全相同")
+
+    # 检测 2: 未使用的代理组
+    unused_groups = [g.name for g in groups if g.name not in used_policies]
+    if unused_groups:
+        suggestions.append(f"⚠️ 未使用的代理组：{', '.join(unused_groups[:5])}")
+
+    # 检测 3: FINAL 规则顺序问题（一次遍历找到第一条 FINAL 规则的位置）
+    final_idx = next((i for i, r in enumerate(all_rules) if r.rule_type == "FINAL"), -1)
+    # 检查 FINAL 是否在最后
+    if 0 <= final_idx < len(all_rules) - 1:
+        rules_after = len(all_rules) - final_idx - 1
+        suggestions.append(
+            f"⚠️ 规则顺序：FINAL 规则（#{all_rules[final_idx].id}）应该在最后，但后面还有 {rules_after} 条规则"
+        )
+
+    # 检测 4: 未使用的代理节点（集合差在数据库中计算；前面的检测已凑满展示条数时不再查询）
+    if len(suggestions) >= _SUGGESTION_LIMIT:
+        return suggestions
+    unused_proxies = load_unused_proxies()
+    if unused_proxies and len(unused_proxies) <= 5:
+        suggestions.append(f"⚠️ 未使用的代理节点：{', '.join(unused_proxies)}")
+
+    return suggestions
 
 
 class ToolExecutor:
@@ -26,61 +259,176 @@ class ToolExecutor:
         self.db = db
         self.current_user = current_user  # 用于审计日志
         self._cache_data = None  # 配置上下文缓存
-        self._cache_timestamp = 0  # 缓存时间戳
-        self.CACHE_TTL = 60  # 缓存有效期（秒）
+        self._cache_version = 0  # 配置版本号，每次成功的修改操作后递增
+        self._cache_key = None  # 缓存生成时的 (配置版本号, 最新版本记录 ID)
+        self._prompt_cache: tuple[str, str] | None = None  # (配置上下文, 渲染后的系统提示词)
 
     def execute(self, tool_name: str, arguments: dict[str, Any]) -> dict[str, Any]:
         """执行工具调用（带审计日志）"""
-        start_time = time.time()
+        start_ns = _now()
         result = None
 
-        handler = getattr(self, f"_handle_{tool_name}", None)
+        handler = _TOOL_HANDLERS.get(tool_name)
         if not handler:
             result = {"success": False, "message": f"未知的工具: {tool_name}"}
         else:
             try:
-                result = handler(arguments)
+                result = handler(self, arguments)
+                # 业务修改与版本记录在同一个事务中一次性提交
+                if result.get("success"):
+                    self.db.commit()
+                    # 修改类工具提交后，配置上下文缓存失效
+                    if tool_name not in _READ_ONLY_TOOLS:
+                        self._cache_version += 1
+                else:
+                    self.db.rollback()
             except Exception as e:
+                self.db.rollback()
                 logger.error(f"工具执行失败: {tool_name}, 错误: {e}", exc_info=True)
                 result = {"success": False, "message": f"执行失败: {str(e)}"}
 
+        success = bool(result.get("success"))
+
+        # 只读工具执行成功时不记录审计日志
+        if success and tool_name in _READ_ONLY_TOOLS:
+            return result
+
         # 计算执行时间
-        execution_time_ms = int((time.time() - start_time) * 1000)
+        execution_time_ms = (_now() - start_ns) // 1_000_000
 
-        # 记录审计日志
+        # 记录审计日志（放入缓冲队列，由后台线程批量写入）
         try:
-            audit_log = AIAuditLog(
-                user_id=self.current_user.id,
-                tool_name=tool_name,
-                arguments=arguments,
-                result=result,
-                success=result.get("success", False),
-                error_message=None if result.get("success") else result.get("message"),
-                execution_time_ms=execution_time_ms
-            )
-            self.db.add(audit_log)
-            self.db.commit()
+            entry = {
+                "user_id": self.current_user.id,
+                "tool_name": tool_name,
+                "arguments": _audit_trim_arguments(arguments),
+                "result": _audit_trim_result(result),
+                "success": success,
+                "error_message": None if success else result.get("message"),
+                "execution_time_ms": execution_time_ms,
+                "created_at": datetime.now(UTC),  # 入队时间，避免记录为批量写入的时间
+            }
+            bind = self.db.get_bind()
+            if isinstance(bind, Engine):
+                get_audit_buffer(bind).put(entry)
+            else:
+                # 会话绑定到单个 Connection（如测试事务）时不能交给后台线程，直接同步写入
+                self.db.add(AIAuditLog(**entry))
+                self.db.commit()
         except Exception as e:
             logger.error(f"审计日志记录失败: {e}", exc_info=True)
             # 审计日志失败不应该影响工具执行结果
 
         return result
 
+    @staticmethod
+    def is_read_only(tool_name: str) -> bool:
+        """是否为只读工具（不修改任何配置）"""
+        return tool_name in _READ_ONLY_TOOLS
+
+    def isolated_runner(self) -> Callable[[str, dict[str, Any]], dict[str, Any]] | None:
+        """返回一个可在其他线程中调用的只读工具执行函数
+
+        Session 不是线程安全的：每次调用都从 Engine 的连接池新建独立会话。
+        会话绑定的不是 Engine（如绑定到某个 Connection 的测试事务）时无法隔离，返回 None，
+        由调用方改为顺序执行。
+        需在当前线程中调用本方法，提前取出用户 ID，避免工作线程访问本会话中的对象。
+        """
+        bind = self.db.get_bind()
+        if not isinstance(bind, Engine):
+            return None
+        user = SimpleNamespace(id=self.current_user.id)
+
+        def run(tool_name: str, arguments: dict[str, Any]) -> dict[str, Any]:
+            with Session(bind=bind) as session:
+                return ToolExecutor(session, user).execute(tool_name, arguments)
+
+        return run
+
     def _model_to_dict(self, obj) -> dict:
         """将 SQLAlchemy 模型对象转换为字典（用于版本记录）"""
         if obj is None:
             return None
 
+        # 已加载的属性直接从实例 __dict__ 读取，未加载（过期）的再走描述符
+        loaded = obj.__dict__
         result = {}
-        for column in obj.__table__.columns:
-            value = getattr(obj, column.name)
-            # 处理特殊类型
-            if hasattr(value, 'isoformat'):  # datetime
-                result[column.name] = value.isoformat()
-            else:
-                result[column.name] = value
+        for name, is_datetime in _columns_of(type(obj)):
+            value = loaded.get(name, _MISSING)
+            if value is _MISSING:
+                value = getattr(obj, name)
+            if is_datetime and value is not None:
+                value = value.isoformat()
+            result[name] = value
         return result
 
+    def _next_sort_order(self, model_class, *criteria) -> int:
+        """获取下一个排序值（当前最大 sort_order + 1，空表为 0）"""
+        return self.db.query(
+            func.coalesce(func.max(model_class.sort_order), -1) + 1
+        ).filter(*criteria).scalar()
+
+    def _exists(self, *criteria) -> bool:
+        """判断是否存在满足条件的记录（SELECT EXISTS，不加载 ORM 对象）"""
+        return self.db.query(exists().where(*criteria)).scalar()
+
+    def _groups_referencing(self, proxy_name: str, *entities) -> list:
+        """查询 members 中引用了指定代理节点的全局代理组（JSON 包含判断下推到数据库）
+
+        entities 为空时返回 ProxyGroupConfig 对象；指定列时返回行（需包含 members 列）。
+        """
+        query = self.db.query(*(entities or (ProxyGroupConfig,))).filter(_GROUP_GLOBAL_FILTER)
+        dialect = self.db.get_bind().dialect.name
+
+        if dialect == "postgresql":
+            return query.filter(cast(ProxyGroupConfig.members, JSONB).contains([proxy_name])).all()
+        if dialect == "sqlite":
+            member = func.json_each(ProxyGroupConfig.members).table_valued("value")
+            return query.filter(
+                select(member.c.value).where(member.c.value == proxy_name).exists()
+            ).all()
+        if dialect in ("mysql", "mariadb"):
+            return query.filter(
+                func.json_contains(ProxyGroupConfig.members, func.json_quote(proxy_name)) == 1
+            ).all()
+
+        # 其他数据库：回退到 Python 中判断
+        return [g for g in query.all() if proxy_name in (g.members or [])]
+
+    def _unused_proxy_names(self, limit: int) -> list[str]:
+        """查询未被任何全局代理组引用的启用代理节点名称（集合差在数据库中完成，最多 limit 个）"""
+        query = self.db.query(ProxyConfig.name).filter(_PROXY_GLOBAL_FILTER, ProxyConfig.is_active == True)
+        dialect = self.db.get_bind().dialect.name
+
+        if dialect == "postgresql":
+            referenced = exists().where(
+                _GROUP_GLOBAL_FILTER,
+                cast(ProxyGroupConfig.members, JSONB).contains(func.jsonb_build_array(ProxyConfig.name)),
+            )
+        elif dialect == "sqlite":
+            member = func.json_each(ProxyGroupConfig.members).table_valued("value")
+            # 显式 JOIN json_each，避免 FROM 中出现无关联条件的笛卡尔积
+            referenced = (
+                select(member.c.value)
+                .select_from(ProxyGroupConfig)
+                .join(member, true())
+                .where(_GROUP_GLOBAL_FILTER, member.c.value == ProxyConfig.name)
+                .exists()
+            )
+        elif dialect in ("mysql", "mariadb"):
+            referenced = exists().where(
+                _GROUP_GLOBAL_FILTER,
+                func.json_contains(ProxyGroupConfig.members, func.json_quote(ProxyConfig.name)) == 1,
+            )
+        else:
+            # 其他数据库：回退到 Python 中计算，只取 members 一列
+            used_names = set()
+            for (members,) in self.db.query(ProxyGroupConfig.members).filter(_GROUP_GLOBAL_FILTER):
+                used_names.update(members or [])
+            return [name for (name,) in query if name not in used_names][:limit]
+
+        return [name for (name,) in query.filter(~referenced).limit(limit)]
+
     def _save_version(
         self,
         resource_type: str,
@@ -89,7 +437,7 @@ class ToolExecutor:
         before_data: dict | None = None,
         after_data: dict | None = None
     ):
-        """保存配置版本记录"""
+        """保存配置版本记录（只加入会话，由 execute 统一提交）"""
         try:
             version = ConfigVersion(
                 user_id=self.current_user.id,
@@ -100,12 +448,36 @@ class ToolExecutor:
                 after_data=after_data
             )
             self.db.add(version)
-            self.db.commit()
             logger.debug(f"版本记录已保存: {resource_type} ID {resource_id}, 操作: {operation_type}")
         except Exception as e:
             logger.error(f"保存版本记录失败: {e}", exc_info=True)
             # 版本记录失败不应该影响主操作
 
+    def _save_versions(self, records: list[tuple[str, int, str, dict | None, dict | None]]):
+        """批量保存配置版本记录
+
+        records 中每项为 (resource_type, resource_id, operation_type, before_data, after_data)，
+        一次 add_all 加入会话，由 execute 统一提交。
+        """
+        if not records:
+            return
+        try:
+            user_id = self.current_user.id
+            self.db.add_all([
+                ConfigVersion(
+                    user_id=user_id,
+                    resource_type=resource_type,
+                    resource_id=resource_id,
+                    operation_type=operation_type,
+                    before_data=before_data,
+                    after_data=after_data
+                )
+                for resource_type, resource_id, operation_type, before_data, after_data in records
+            ])
+            logger.debug(f"批量保存版本记录 {len(records)} 条")
+        except Exception as e:
+            logger.error(f"批量保存版本记录失败: {e}", exc_info=True)
+
     def _handle_create_rule(self, args: dict[str, Any]) -> dict[str, Any]:
         """创建规则"""
         rule_type = args.get("rule_type")
@@ -116,10 +488,8 @@ class ToolExecutor:
         if not all([rule_type, value, policy]):
             return {"success": False, "message": "缺少必要参数: rule_type, value, policy"}
 
-        # 获取当前最大排序值
-        max_order = self.db.query(RuleConfig).filter(
-            RuleConfig.device_id.is_(None)
-        ).count()
+        # 获取下一个排序值
+        max_order = self._next_sort_order(RuleConfig, _RULE_GLOBAL_FILTER)
 
         config = RuleConfig(
             device_id=None,
@@ -130,8 +500,7 @@ class ToolExecutor:
             sort_order=max_order,
         )
         self.db.add(config)
-        self.db.commit()
-        self.db.refresh(config)
+        self.db.flush()
 
         # 保存版本记录
         self._save_version(
@@ -157,8 +526,10 @@ class ToolExecutor:
         """查询规则列表"""
         keyword = args.get("keyword", "").lower()
         limit = args.get("limit", 20)
+        # 输出格式：data 只返回结构化数据，text 只返回文本，both（默认）两者都返回
+        output_format = args.get("format", "both")
 
-        query = self.db.query(RuleConfig).filter(RuleConfig.device_id.is_(None))
+        query = self.db.query(RuleConfig).filter(_RULE_GLOBAL_FILTER)
 
         # 如果有关键词，使用数据库 LIKE 查询（性能优化）
         if keyword:
@@ -169,7 +540,10 @@ class ToolExecutor:
                 (RuleConfig.comment.like(search_pattern))
             )
 
-        rules = query.order_by(RuleConfig.sort_order).limit(limit).all()
+        # 只取展示需要的列
+        rules = query.with_entities(
+            RuleConfig.id, RuleConfig.rule_type, RuleConfig.value, RuleConfig.policy, RuleConfig.comment,
+        ).order_by(RuleConfig.sort_order).limit(limit).all()
 
         if not rules:
             return {
@@ -180,29 +554,31 @@ class ToolExecutor:
 
         # 构建详细的规则信息
         rules_info = []
-        for r in rules:
-            rules_info.append({
-                "id": r.id,
-                "rule_type": r.rule_type,
-                "value": r.value,
-                "policy": r.policy,
-                "comment": r.comment,
-            })
+        if output_format != "text":
+            rules_info = [
+                {
+                    "id": r.id,
+                    "rule_type": r.rule_type,
+                    "value": r.value,
+                    "policy": r.policy,
+                    "comment": r.comment,
+                }
+                for r in rules
+            ]
 
-        # 构建更清晰的表格样式文本
-        lines = [f"📋 查询到 {len(rules)} 条规则" + (f"（关键词: {keyword}）" if keyword else "") + "：", ""]
-        for r in rules:
-            # 显示完整的 value（便于 AI 提取 IP/域名）
-            line = f"#{r.id}  {r.rule_type}  →  {r.policy}"
-            lines.append(line)
-            lines.append(f"    value: {r.value}")
-            if r.comment:
-                lines.append(f"    💬 {r.comment}")
-            lines.append("")  # 空行分隔
+        # 构建更清晰的表格样式文本（显示完整的 value，便于 AI 提取 IP/域名）
+        message = ""
+        if output_format != "data":
+            header = f"📋 查询到 {len(rules)} 条规则" + (f"（关键词: {keyword}）" if keyword else "") + "："
+            message = _render_blocks(header, (
+                f"#{r.id}  {r.rule_type}  →  {r.policy}\n    value: {r.value}"
+                + (f"\n    💬 {r.comment}" if r.comment else "")
+                for r in rules
+            ))
 
         return {
             "success": True,
-            "message": "\n".join(lines),
+            "message": message,
             "data": rules_info
         }
 
@@ -213,10 +589,7 @@ class ToolExecutor:
         if not rule_id:
             return {"success": False, "message": "缺少 rule_id 参数"}
 
-        config = self.db.query(RuleConfig).filter(
-            RuleConfig.id == rule_id,
-            RuleConfig.device_id.is_(None)
-        ).first()
+        config = self.db.execute(_RULE_BY_ID, {"id": rule_id}).scalar_one_or_none()
 
         if not config:
             return {"success": False, "message": f"规则 ID {rule_id} 不存在"}
@@ -225,7 +598,6 @@ class ToolExecutor:
         before_data = self._model_to_dict(config)
 
         self.db.delete(config)
-        self.db.commit()
 
         # 保存版本记录
         self._save_version(
@@ -242,7 +614,8 @@ class ToolExecutor:
         """获取策略组列表"""
         groups = (
             self.db.query(ProxyGroupConfig)
-            .filter(ProxyGroupConfig.device_id.is_(None))
+            .options(*_list_load_options())
+            .filter(_GROUP_GLOBAL_FILTER)
             .all()
         )
         # 添加内置策略
@@ -266,10 +639,7 @@ class ToolExecutor:
         if not rule_id:
             return {"success": False, "message": "缺少 rule_id 参数"}
 
-        config = self.db.query(RuleConfig).filter(
-            RuleConfig.id == rule_id,
-            RuleConfig.device_id.is_(None)
-        ).first()
+        config = self.db.execute(_RULE_BY_ID, {"id": rule_id}).scalar_one_or_none()
 
         if not config:
             return {"success": False, "message": f"规则 ID {rule_id} 不存在"}
@@ -294,8 +664,7 @@ class ToolExecutor:
         if not update_fields:
             return {"success": False, "message": "❌ 未提供任何要更新的字段"}
 
-        self.db.commit()
-        self.db.refresh(config)
+        self.db.flush()
 
         # 保存版本记录
         self._save_version(
@@ -323,16 +692,16 @@ class ToolExecutor:
         """查询代理节点列表"""
         keyword = args.get("keyword", "").lower()
 
-        proxies = (
-            self.db.query(ProxyConfig)
-            .filter(ProxyConfig.device_id.is_(None), ProxyConfig.is_active == True)
-            .all()
-        )
-
+        # 关键词过滤下推到数据库，只查询需要的列
+        query = self.db.query(
+            ProxyConfig.name, ProxyConfig.protocol, ProxyConfig.server, ProxyConfig.port
+        ).filter(_PROXY_GLOBAL_FILTER, ProxyConfig.is_active == True)
         if keyword:
-            proxies = [p for p in proxies if keyword in p.name.lower()]
+            # 匹配 lower(name)，可命中数据库上的小写表达式索引
+            query = query.filter(func.lower(ProxyConfig.name).like(f"%{keyword}%"))
 
-        if not proxies:
+        total = query.count()
+        if not total:
             return {
                 "success": True,
                 "message": "未找到代理节点" if not keyword else f"未找到包含 '{keyword}' 的代理",
@@ -345,12 +714,12 @@ class ToolExecutor:
                 "protocol": p.protocol,
                 "server": f"{p.server}:{p.port}" if p.server else "外部引用",
             }
-            for p in proxies[:20]
+            for p in query.limit(20).all()
         ]
 
         return {
             "success": True,
-            "message": f"共 {len(proxies)} 个代理节点",
+            "message": f"共 {total} 个代理节点",
             "data": proxy_info
         }
 
@@ -358,26 +727,28 @@ class ToolExecutor:
         """查询主机映射列表"""
         keyword = args.get("keyword", "").lower()
 
-        hosts = (
-            self.db.query(HostConfig)
-            .filter(HostConfig.device_id.is_(None), HostConfig.is_active == True)
-            .all()
-        )
-
+        query = self.db.query(
+            HostConfig.id, HostConfig.hostname, HostConfig.target, HostConfig.description
+        ).filter(_HOST_GLOBAL_FILTER, HostConfig.is_active == True)
         if keyword:
-            hosts = [h for h in hosts if keyword in h.hostname.lower() or keyword in (h.target or "").lower()]
+            search_pattern = f"%{keyword}%"
+            query = query.filter(
+                (func.lower(HostConfig.hostname).like(search_pattern)) |
+                (func.lower(HostConfig.target).like(search_pattern))
+            )
+
+        hosts = query.all()
 
         if not hosts:
             return {"success": True, "message": "暂无主机映射", "data": []}
 
-        lines = [f"📍 共 {len(hosts)} 条主机映射：", ""]
-        for h in hosts[:15]:
-            lines.append(f"#{h.id}  {h.hostname}  →  {h.target}")
-            if h.description:
-                lines.append(f"    💬 {h.description}")
-            lines.append("")
+        message = _render_blocks(f"📍 共 {len(hosts)} 条主机映射：", (
+            f"#{h.id}  {h.hostname}  →  {h.target}"
+            + (f"\n    💬 {h.description}" if h.description else "")
+            for h in hosts[:15]
+        ))
 
-        return {"success": True, "message": "\n".join(lines), "data": [{"id": h.id, "hostname": h.hostname, "target": h.target} for h in hosts]}
+        return {"success": True, "message": message, "data": [{"id": h.id, "hostname": h.hostname, "target": h.target} for h in hosts]}
 
     def _handle_create_host(self, args: dict[str, Any]) -> dict[str, Any]:
         """创建主机映射"""
@@ -395,8 +766,7 @@ class ToolExecutor:
             description=description,
         )
         self.db.add(host)
-        self.db.commit()
-        self.db.refresh(host)
+        self.db.flush()
 
         # 保存版本记录
         self._save_version(
@@ -419,7 +789,7 @@ class ToolExecutor:
         if not host_id:
             return {"success": False, "message": "缺少 host_id 参数"}
 
-        host = self.db.query(HostConfig).filter(HostConfig.id == host_id).first()
+        host = self.db.get(HostConfig, host_id)
         if not host:
             return {"success": False, "message": f"主机映射 ID {host_id} 不存在"}
 
@@ -428,7 +798,6 @@ class ToolExecutor:
         hostname = host.hostname
 
         self.db.delete(host)
-        self.db.commit()
 
         # 保存版本记录
         self._save_version(
@@ -445,26 +814,26 @@ class ToolExecutor:
         """查询通用配置列表"""
         keyword = args.get("keyword", "").lower()
 
-        configs = (
-            self.db.query(GeneralConfig)
-            .filter(GeneralConfig.device_id.is_(None), GeneralConfig.is_active == True)
-            .order_by(GeneralConfig.sort_order)
-            .all()
-        )
-
+        query = self.db.query(
+            GeneralConfig.id, GeneralConfig.key, GeneralConfig.value
+        ).filter(_GEN_GLOBAL_FILTER, GeneralConfig.is_active == True)
         if keyword:
-            configs = [c for c in configs if keyword in c.key.lower() or keyword in (c.value or "").lower()]
+            search_pattern = f"%{keyword}%"
+            query = query.filter(
+                (GeneralConfig.key.ilike(search_pattern)) |
+                (GeneralConfig.value.ilike(search_pattern))
+            )
+
+        configs = query.order_by(GeneralConfig.sort_order).all()
 
         if not configs:
             return {"success": True, "message": "暂无通用配置", "data": []}
 
-        lines = [f"⚙️ 共 {len(configs)} 项通用配置：", ""]
-        for c in configs[:20]:
-            value = c.value[:50] + "..." if len(c.value or "") > 50 else c.value
-            lines.append(f"#{c.id}  {c.key} = {value}")
-            lines.append("")
+        message = _render_blocks(f"⚙️ 共 {len(configs)} 项通用配置：", (
+            f"#{c.id}  {c.key} = {_truncate(c.value, 50)}" for c in configs[:20]
+        ))
 
-        return {"success": True, "message": "\n".join(lines), "data": [{"id": c.id, "key": c.key, "value": c.value} for c in configs]}
+        return {"success": True, "message": message, "data": [{"id": c.id, "key": c.key, "value": c.value} for c in configs]}
 
     def _handle_update_general_config(self, args: dict[str, Any]) -> dict[str, Any]:
         """修改通用配置"""
@@ -475,7 +844,7 @@ class ToolExecutor:
             return {"success": False, "message": "缺少 key 或 value 参数"}
 
         config = self.db.query(GeneralConfig).filter(
-            GeneralConfig.device_id.is_(None),
+            _GEN_GLOBAL_FILTER,
             GeneralConfig.key == key
         ).first()
 
@@ -483,8 +852,7 @@ class ToolExecutor:
             # 创建新配置
             config = GeneralConfig(device_id=None, key=key, value=value)
             self.db.add(config)
-            self.db.commit()
-            self.db.refresh(config)
+            self.db.flush()
 
             # 保存版本记录
             self._save_version(
@@ -501,8 +869,7 @@ class ToolExecutor:
             before_data = self._model_to_dict(config)
             old_value = config.value
             config.value = value
-            self.db.commit()
-            self.db.refresh(config)
+            self.db.flush()
 
             # 保存版本记录
             self._save_version(
@@ -533,45 +900,52 @@ class ToolExecutor:
             return {"success": False, "message": "缺少 old_policy 或 new_policy 参数"}
 
         # 查找所有使用旧策略的规则
-        rules = (
-            self.db.query(RuleConfig)
-            .filter(
-                RuleConfig.device_id.is_(None),
-                RuleConfig.policy == old_policy
-            )
-            .all()
+        query = self.db.query(RuleConfig).filter(
+            _RULE_GLOBAL_FILTER,
+            RuleConfig.policy == old_policy
         )
-
-        if not rules:
-            return {
-                "success": True,
-                "message": f"未找到使用策略 '{old_policy}' 的规则",
-                "data": {"affected_count": 0}
-            }
+        not_found = {
+            "success": True,
+            "message": f"未找到使用策略 '{old_policy}' 的规则",
+            "data": {"affected_count": 0}
+        }
 
         # 预览或执行
         if dry_run:
-            lines = [f"🔍 预览：将替换 {len(rules)} 条规则的策略（{old_policy} → {new_policy}）：", ""]
-            for r in rules[:20]:
-                value = r.value[:40] + "..." if len(r.value or "") > 40 else r.value
-                lines.append(f"  [ID:{r.id}] {r.rule_type}, {value}")
-            if len(rules) > 20:
-                lines.append(f"  ... 还有 {len(rules) - 20} 条规则")
+            total = query.count()
+            if not total:
+                return not_found
+
+            # 预览只取展示用的列和前 20 条
+            preview_rows = query.with_entities(
+                RuleConfig.id, RuleConfig.rule_type, RuleConfig.value
+            ).limit(20).all()
+            lines = [f"🔍 预览：将替换 {total} 条规则的策略（{old_policy} → {new_policy}）：", ""]
+            lines.extend(f"  [ID:{r.id}] {r.rule_type}, {_truncate(r.value, 40)}" for r in preview_rows)
+            if total > 20:
+                lines.append(f"  ... 还有 {total - 20} 条规则")
             return {
                 "success": True,
                 "message": "\n".join(lines),
-                "data": {"affected_count": len(rules), "preview": True}
+                "data": {"affected_count": total, "preview": True}
             }
         else:
-            # 执行批量更新
-            for rule in rules:
-                rule.policy = new_policy
-            self.db.commit()
+            # 执行批量更新（单条 UPDATE 语句，不加载 ORM 对象）
+            rule_ids = [rule_id for (rule_id,) in query.with_entities(RuleConfig.id).all()]
+            if not rule_ids:
+                return not_found
+            affected = query.update({RuleConfig.policy: new_policy}, synchronize_session=False)
+
+            # 每条规则记录一条只含 policy 的版本，可按条回滚
+            self._save_versions([
+                ("rule", rule_id, "update", {"policy": old_policy}, {"policy": new_policy})
+                for rule_id in rule_ids
+            ])
 
             return {
                 "success": True,
-                "message": f"✅ 成功将 {len(rules)} 条规则的策略从 '{old_policy}' 替换为 '{new_policy}'",
-                "data": {"affected_count": len(rules)}
+                "message": f"✅ 成功将 {affected} 条规则的策略从 '{old_policy}' 替换为 '{new_policy}'",
+                "data": {"affected_count": affected}
             }
 
     def _handle_create_proxy_group(self, args: dict[str, Any]) -> dict[str, Any]:
@@ -585,18 +959,11 @@ class ToolExecutor:
             return {"success": False, "message": "❌ 缺少必要参数: name, group_type"}
 
         # 检查名称是否已存在
-        existing = (
-            self.db.query(ProxyGroupConfig)
-            .filter(ProxyGroupConfig.device_id.is_(None), ProxyGroupConfig.name == name)
-            .first()
-        )
-        if existing:
+        if self._exists(_GROUP_GLOBAL_FILTER, ProxyGroupConfig.name == name):
             return {"success": False, "message": f"❌ 代理组 '{name}' 已存在"}
 
-        # 获取当前最大排序值
-        max_order = self.db.query(ProxyGroupConfig).filter(
-            ProxyGroupConfig.device_id.is_(None)
-        ).count()
+        # 获取下一个排序值
+        max_order = self._next_sort_order(ProxyGroupConfig, _GROUP_GLOBAL_FILTER)
 
         config = ProxyGroupConfig(
             device_id=None,
@@ -607,8 +974,7 @@ class ToolExecutor:
             sort_order=max_order,
         )
         self.db.add(config)
-        self.db.commit()
-        self.db.refresh(config)
+        self.db.flush()
 
         # 保存版本记录
         self._save_version(
@@ -636,27 +1002,18 @@ class ToolExecutor:
         if not group_id:
             return {"success": False, "message": "❌ 缺少 group_id 参数"}
 
-        config = (
-            self.db.query(ProxyGroupConfig)
-            .filter(ProxyGroupConfig.id == group_id, ProxyGroupConfig.device_id.is_(None))
-            .first()
-        )
+        config = self.db.execute(_PROXY_GROUP_BY_ID, {"id": group_id}).scalar_one_or_none()
         if not config:
             return {"success": False, "message": f"❌ 代理组 ID {group_id} 不存在"}
 
         # 检查名称冲突
         new_name = args.get("name")
         if new_name and new_name != config.name:
-            existing = (
-                self.db.query(ProxyGroupConfig)
-                .filter(
-                    ProxyGroupConfig.device_id.is_(None),
-                    ProxyGroupConfig.name == new_name,
-                    ProxyGroupConfig.id != group_id
-                )
-                .first()
-            )
-            if existing:
+            if self._exists(
+                _GROUP_GLOBAL_FILTER,
+                ProxyGroupConfig.name == new_name,
+                ProxyGroupConfig.id != group_id
+            ):
                 return {"success": False, "message": f"❌ 代理组名称 '{new_name}' 已被使用"}
 
         # 保存更新前的数据
@@ -680,8 +1037,7 @@ class ToolExecutor:
         if not update_fields:
             return {"success": False, "message": "❌ 未提供任何要更新的字段"}
 
-        self.db.commit()
-        self.db.refresh(config)
+        self.db.flush()
 
         # 保存版本记录
         self._save_version(
@@ -709,11 +1065,7 @@ class ToolExecutor:
         if not group_id:
             return {"success": False, "message": "❌ 缺少 group_id 参数"}
 
-        config = (
-            self.db.query(ProxyGroupConfig)
-            .filter(ProxyGroupConfig.id == group_id, ProxyGroupConfig.device_id.is_(None))
-            .first()
-        )
+        config = self.db.execute(_PROXY_GROUP_BY_ID, {"id": group_id}).scalar_one_or_none()
         if not config:
             return {"success": False, "message": f"❌ 代理组 ID {group_id} 不存在"}
 
@@ -721,7 +1073,7 @@ class ToolExecutor:
         group_name = config.name
         referenced_rules = (
             self.db.query(RuleConfig)
-            .filter(RuleConfig.device_id.is_(None), RuleConfig.policy == group_name)
+            .filter(_RULE_GLOBAL_FILTER, RuleConfig.policy == group_name)
             .count()
         )
         if referenced_rules > 0:
@@ -734,7 +1086,6 @@ class ToolExecutor:
         before_data = self._model_to_dict(config)
 
         self.db.delete(config)
-        self.db.commit()
 
         # 保存版本记录
         self._save_version(
@@ -764,18 +1115,11 @@ class ToolExecutor:
             return {"success": False, "message": "❌ 缺少必要参数: name, protocol, server, port"}
 
         # 检查名称是否已存在
-        existing = (
-            self.db.query(ProxyConfig)
-            .filter(ProxyConfig.device_id.is_(None), ProxyConfig.name == name)
-            .first()
-        )
-        if existing:
+        if self._exists(_PROXY_GLOBAL_FILTER, ProxyConfig.name == name):
             return {"success": False, "message": f"❌ 代理节点 '{name}' 已存在"}
 
-        # 获取当前最大排序值
-        max_order = self.db.query(ProxyConfig).filter(
-            ProxyConfig.device_id.is_(None)
-        ).count()
+        # 获取下一个排序值
+        max_order = self._next_sort_order(ProxyConfig, _PROXY_GLOBAL_FILTER)
 
         config = ProxyConfig(
             device_id=None,
@@ -788,8 +1132,7 @@ class ToolExecutor:
             sort_order=max_order,
         )
         self.db.add(config)
-        self.db.commit()
-        self.db.refresh(config)
+        self.db.flush()
 
         # 保存版本记录
         self._save_version(
@@ -818,27 +1161,18 @@ class ToolExecutor:
         if not proxy_id:
             return {"success": False, "message": "❌ 缺少 proxy_id 参数"}
 
-        config = (
-            self.db.query(ProxyConfig)
-            .filter(ProxyConfig.id == proxy_id, ProxyConfig.device_id.is_(None))
-            .first()
-        )
+        config = self.db.execute(_PROXY_BY_ID, {"id": proxy_id}).scalar_one_or_none()
         if not config:
             return {"success": False, "message": f"❌ 代理节点 ID {proxy_id} 不存在"}
 
         # 检查名称冲突
         new_name = args.get("name")
         if new_name and new_name != config.name:
-            existing = (
-                self.db.query(ProxyConfig)
-                .filter(
-                    ProxyConfig.device_id.is_(None),
-                    ProxyConfig.name == new_name,
-                    ProxyConfig.id != proxy_id
-                )
-                .first()
-            )
-            if existing:
+            if self._exists(
+                _PROXY_GLOBAL_FILTER,
+                ProxyConfig.name == new_name,
+                ProxyConfig.id != proxy_id
+            ):
                 return {"success": False, "message": f"❌ 代理节点名称 '{new_name}' 已被使用"}
 
         # 保存更新前的数据
@@ -869,22 +1203,25 @@ class ToolExecutor:
 
         # 如果名称改变，需要更新所有引用该节点的代理组
         if new_name and new_name != old_name:
-            groups = (
-                self.db.query(ProxyGroupConfig)
-                .filter(ProxyGroupConfig.device_id.is_(None))
-                .all()
-            )
-            updated_groups = 0
-            for group in groups:
-                if old_name in group.members:
-                    group.members = [new_name if m == old_name else m for m in group.members]
-                    updated_groups += 1
+            # 只查询 id 和 members 两列，按主键批量执行一次 UPDATE
+            rows = self._groups_referencing(old_name, ProxyGroupConfig.id, ProxyGroupConfig.members)
+            group_updates = []
+            group_versions = []
+            for group_id, old_members in rows:
+                new_members = [new_name if m == old_name else m for m in old_members]
+                group_updates.append({"id": group_id, "members": new_members})
+                group_versions.append(
+                    ("proxy_group", group_id, "update", {"members": old_members}, {"members": new_members})
+                )
+            if group_updates:
+                self.db.execute(update(ProxyGroupConfig), group_updates)
+            self._save_versions(group_versions)
+            updated_groups = len(group_updates)
 
             if updated_groups > 0:
                 update_fields.append(f"更新了 {updated_groups} 个代理组的引用")
 
-        self.db.commit()
-        self.db.refresh(config)
+        self.db.flush()
 
         # 保存版本记录
         self._save_version(
@@ -913,26 +1250,15 @@ class ToolExecutor:
         if not proxy_id:
             return {"success": False, "message": "❌ 缺少 proxy_id 参数"}
 
-        config = (
-            self.db.query(ProxyConfig)
-            .filter(ProxyConfig.id == proxy_id, ProxyConfig.device_id.is_(None))
-            .first()
-        )
+        config = self.db.execute(_PROXY_BY_ID, {"id": proxy_id}).scalar_one_or_none()
         if not config:
             return {"success": False, "message": f"❌ 代理节点 ID {proxy_id} 不存在"}
 
         # 检查是否被代理组引用
         proxy_name = config.name
-        groups = (
-            self.db.query(ProxyGroupConfig)
-            .filter(ProxyGroupConfig.device_id.is_(None))
-            .all()
-        )
-
-        referenced_groups = []
-        for group in groups:
-            if proxy_name in group.members:
-                referenced_groups.append(group.name)
+        referenced_groups = [
+            g.name for g in self._groups_referencing(proxy_name, ProxyGroupConfig.name, ProxyGroupConfig.members)
+        ]
 
         if referenced_groups:
             return {
@@ -944,7 +1270,6 @@ class ToolExecutor:
         before_data = self._model_to_dict(config)
 
         self.db.delete(config)
-        self.db.commit()
 
         # 保存版本记录
         self._save_version(
@@ -961,42 +1286,65 @@ class ToolExecutor:
             "data": {"id": proxy_id, "name": proxy_name}
         }
 
+    def _swap_rule_with_neighbor(self, rule_id: int, upward: bool) -> tuple | None:
+        """与相邻规则交换 sort_order
+
+        一次查询取出规则及其上一条/下一条规则，再用单条 UPDATE ... CASE 交换两者的排序值。
+        规则不存在时返回 None；否则返回 (规则行, 相邻规则行)，没有相邻规则时相邻规则行为 None。
+        """
+        current_order = (
+            select(RuleConfig.sort_order)
+            .where(RuleConfig.id == rule_id, _RULE_GLOBAL_FILTER)
+            .scalar_subquery()
+        )
+        if upward:
+            neighbor, ordering = RuleConfig.sort_order < current_order, RuleConfig.sort_order.desc()
+        else:
+            neighbor, ordering = RuleConfig.sort_order > current_order, RuleConfig.sort_order.asc()
+
+        # 第一行是规则本身，第二行（如果有）是最近的相邻规则
+        rows = (
+            self.db.query(RuleConfig.id, RuleConfig.sort_order)
+            .filter(_RULE_GLOBAL_FILTER, (RuleConfig.id == rule_id) | neighbor)
+            .order_by(ordering)
+            .limit(2)
+            .all()
+        )
+        if not rows:
+            return None
+        if len(rows) < 2:
+            return rows[0], None
+
+        rule, other = rows
+        self.db.execute(
+            update(RuleConfig)
+            .where(RuleConfig.id.in_([rule.id, other.id]))
+            .values(sort_order=case(
+                {rule.id: other.sort_order, other.id: rule.sort_order},
+                value=RuleConfig.id,
+            ))
+            .execution_options(synchronize_session=False)
+        )
+        return rule, other
+
     def _handle_move_rule_up(self, args: dict[str, Any]) -> dict[str, Any]:
         """上移规则"""
         rule_id = args.get("rule_id")
         if not rule_id:
             return {"success": False, "message": "❌ 缺少 rule_id 参数"}
 
-        rule = (
-            self.db.query(RuleConfig)
-            .filter(RuleConfig.id == rule_id, RuleConfig.device_id.is_(None))
-            .first()
-        )
-        if not rule:
+        swapped = self._swap_rule_with_neighbor(rule_id, upward=True)
+        if not swapped:
             return {"success": False, "message": f"❌ 规则 ID {rule_id} 不存在"}
 
-        # 找到上一条规则
-        prev_rule = (
-            self.db.query(RuleConfig)
-            .filter(
-                RuleConfig.device_id.is_(None),
-                RuleConfig.sort_order < rule.sort_order
-            )
-            .order_by(RuleConfig.sort_order.desc())
-            .first()
-        )
-
+        _, prev_rule = swapped
         if not prev_rule:
             return {"success": False, "message": "❌ 规则已在最顶部，无法上移"}
 
-        # 交换 sort_order
-        rule.sort_order, prev_rule.sort_order = prev_rule.sort_order, rule.sort_order
-        self.db.commit()
-
         return {
             "success": True,
             "message": f"✅ 规则 #{rule_id} 已上移",
-            "data": {"id": rule_id, "new_position": rule.sort_order}
+            "data": {"id": rule_id, "new_position": prev_rule.sort_order}
         }
 
     def _handle_move_rule_down(self, args: dict[str, Any]) -> dict[str, Any]:
@@ -1005,36 +1353,18 @@ class ToolExecutor:
         if not rule_id:
             return {"success": False, "message": "❌ 缺少 rule_id 参数"}
 
-        rule = (
-            self.db.query(RuleConfig)
-            .filter(RuleConfig.id == rule_id, RuleConfig.device_id.is_(None))
-            .first()
-        )
-        if not rule:
+        swapped = self._swap_rule_with_neighbor(rule_id, upward=False)
+        if not swapped:
             return {"success": False, "message": f"❌ 规则 ID {rule_id} 不存在"}
 
-        # 找到下一条规则
-        next_rule = (
-            self.db.query(RuleConfig)
-            .filter(
-                RuleConfig.device_id.is_(None),
-                RuleConfig.sort_order > rule.sort_order
-            )
-            .order_by(RuleConfig.sort_order.asc())
-            .first()
-        )
-
+        _, next_rule = swapped
         if not next_rule:
             return {"success": False, "message": "❌ 规则已在最底部，无法下移"}
 
-        # 交换 sort_order
-        rule.sort_order, next_rule.sort_order = next_rule.sort_order, rule.sort_order
-        self.db.commit()
-
         return {
             "success": True,
             "message": f"✅ 规则 #{rule_id} 已下移",
-            "data": {"id": rule_id, "new_position": rule.sort_order}
+            "data": {"id": rule_id, "new_position": next_rule.sort_order}
         }
 
     def _handle_reorder_rules(self, args: dict[str, Any]) -> dict[str, Any]:
@@ -1043,24 +1373,26 @@ class ToolExecutor:
         if not orders:
             return {"success": False, "message": "❌ 缺少 orders 参数"}
 
-        updated_count = 0
-        for item in orders:
-            rule_id = item.get("id")
-            sort_order = item.get("sort_order")
-
-            if rule_id is None or sort_order is None:
-                continue
-
-            rule = (
-                self.db.query(RuleConfig)
-                .filter(RuleConfig.id == rule_id, RuleConfig.device_id.is_(None))
-                .first()
+        # 一次查询出有效的全局规则 ID，再按主键批量更新（executemany）
+        requested = {
+            item["id"]: item["sort_order"]
+            for item in orders
+            if item.get("id") is not None and item.get("sort_order") is not None
+        }
+        valid_ids = {
+            rule_id for (rule_id,) in (
+                self.db.query(RuleConfig.id)
+                .filter(RuleConfig.id.in_(list(requested)), _RULE_GLOBAL_FILTER)
             )
-            if rule:
-                rule.sort_order = sort_order
-                updated_count += 1
-
-        self.db.commit()
+        }
+        mappings = [
+            {"id": rule_id, "sort_order": sort_order}
+            for rule_id, sort_order in requested.items()
+            if rule_id in valid_ids
+        ]
+        if mappings:
+            self.db.bulk_update_mappings(RuleConfig, mappings)
+        updated_count = len(mappings)
 
         return {
             "success": True,
@@ -1068,7 +1400,6 @@ class ToolExecutor:
             "data": {"updated_count": updated_count}
         }
 
-    @with_transaction
     def _handle_batch_delete_rules(self, args: dict[str, Any]) -> dict[str, Any]:
         """批量删除规则"""
         keyword = args.get("keyword", "").lower()
@@ -1077,7 +1408,7 @@ class ToolExecutor:
         dry_run = args.get("dry_run", True)
 
         # 构建查询
-        query = self.db.query(RuleConfig).filter(RuleConfig.device_id.is_(None))
+        query = self.db.query(RuleConfig).filter(_RULE_GLOBAL_FILTER)
 
         # 应用过滤条件
         if keyword:
@@ -1092,16 +1423,17 @@ class ToolExecutor:
         if policy:
             query = query.filter(RuleConfig.policy == policy)
 
-        rules = query.all()
-
-        if not rules:
-            return {
-                "success": False,
-                "message": "❌ 未找到匹配条件的规则"
-            }
+        not_found = {
+            "success": False,
+            "message": "❌ 未找到匹配条件的规则"
+        }
 
         # 预览模式
         if dry_run:
+            total_count = query.with_entities(func.count(RuleConfig.id)).scalar()
+            if not total_count:
+                return not_found
+
             preview = [
                 {
                     "id": r.id,
@@ -1109,25 +1441,27 @@ class ToolExecutor:
                     "value": r.value[:40] + "..." if len(r.value) > 40 else r.value,
                     "policy": r.policy
                 }
-                for r in rules[:10]
+                for r in query.with_entities(
+                    RuleConfig.id, RuleConfig.rule_type, RuleConfig.value, RuleConfig.policy
+                ).limit(10)
             ]
             return {
                 "success": False,
-                "message": f"⚠️ 预览模式：找到 {len(rules)} 条规则将被删除。设置 dry_run=false 确认删除",
-                "data": {"preview": preview, "total_count": len(rules)}
+                "message": f"⚠️ 预览模式：找到 {total_count} 条规则将被删除。设置 dry_run=false 确认删除",
+                "data": {"preview": preview, "total_count": total_count}
             }
 
-        # 执行删除
-        for rule in rules:
-            self.db.delete(rule)
+        # 执行删除（单条 DELETE ... WHERE 语句）
+        deleted_count = query.delete(synchronize_session=False)
+        if not deleted_count:
+            return not_found
 
         return {
             "success": True,
-            "message": f"✅ 成功删除 {len(rules)} 条规则",
-            "data": {"deleted_count": len(rules)}
+            "message": f"✅ 成功删除 {deleted_count} 条规则",
+            "data": {"deleted_count": deleted_count}
         }
 
-    @with_transaction
     def _handle_batch_update_comments(self, args: dict[str, Any]) -> dict[str, Any]:
         """批量更新规则注释"""
         rule_ids = args.get("rule_ids", [])
@@ -1136,16 +1470,12 @@ class ToolExecutor:
         if not rule_ids:
             return {"success": False, "message": "❌ 缺少 rule_ids 参数"}
 
-        updated_count = 0
-        for rule_id in rule_ids:
-            rule = (
-                self.db.query(RuleConfig)
-                .filter(RuleConfig.id == rule_id, RuleConfig.device_id.is_(None))
-                .first()
-            )
-            if rule:
-                rule.comment = comment
-                updated_count += 1
+        # 单条 UPDATE ... WHERE id IN (...) 语句
+        updated_count = (
+            self.db.query(RuleConfig)
+            .filter(RuleConfig.id.in_(rule_ids), _RULE_GLOBAL_FILTER)
+            .update({RuleConfig.comment: comment}, synchronize_session=False)
+        )
 
         if updated_count == 0:
             return {"success": False, "message": "❌ 未找到任何规则"}
@@ -1170,12 +1500,11 @@ class ToolExecutor:
             return {"success": False, "message": "❌ 缺少必要参数: name, public_key, endpoint, allowed_ips"}
 
         # 检查名称是否已存在
-        existing = self.db.query(WireGuardPeerService).filter(WireGuardPeerService.name == name).first()
-        if existing:
+        if self._exists(WireGuardPeerService.name == name):
             return {"success": False, "message": f"❌ 对端服务 '{name}' 已存在"}
 
         # 获取当前最大排序值
-        max_order = self.db.query(WireGuardPeerService).count()
+        max_order = self._next_sort_order(WireGuardPeerService)
 
         service = WireGuardPeerService(
             name=name,
@@ -1188,8 +1517,12 @@ class ToolExecutor:
             sort_order=max_order,
         )
         self.db.add(service)
-        self.db.commit()
-        self.db.refresh(service)
+        try:
+            self.db.flush()
+        except IntegrityError:
+            # 并发创建同名服务时由数据库唯一约束兜底
+            self.db.rollback()
+            return {"success": False, "message": f"❌ 对端服务 '{name}' 已存在"}
 
         # 保存版本记录
         self._save_version(
@@ -1210,13 +1543,21 @@ class ToolExecutor:
         """列出 WireGuard 对端服务"""
         keyword = args.get("keyword", "").lower()
 
-        services = self.db.query(WireGuardPeerService).order_by(WireGuardPeerService.sort_order).all()
-
+        # 关键词过滤下推到数据库，只查询需要的列
+        query = self.db.query(
+            WireGuardPeerService.id,
+            WireGuardPeerService.name,
+            WireGuardPeerService.endpoint,
+            WireGuardPeerService.allowed_ips,
+        )
         if keyword:
-            services = [
-                s for s in services
-                if keyword in s.name.lower() or keyword in (s.description or "").lower()
-            ]
+            search_pattern = f"%{keyword}%"
+            query = query.filter(
+                (func.lower(WireGuardPeerService.name).like(search_pattern)) |
+                (func.lower(WireGuardPeerService.description).like(search_pattern))
+            )
+
+        services = query.order_by(WireGuardPeerService.sort_order).all()
 
         if not services:
             return {"success": True, "message": "📋 未找到 WireGuard 对端服务", "data": []}
@@ -1243,53 +1584,42 @@ class ToolExecutor:
         if not service_id:
             return {"success": False, "message": "❌ 缺少 service_id 参数"}
 
-        service = self.db.query(WireGuardPeerService).filter(WireGuardPeerService.id == service_id).first()
+        service = self.db.execute(_WG_PEER_SERVICE_BY_ID, {"id": service_id}).scalar_one_or_none()
         if not service:
             return {"success": False, "message": f"❌ 对端服务 ID {service_id} 不存在"}
 
         # 检查名称冲突
         new_name = args.get("name")
         if new_name and new_name != service.name:
-            existing = (
-                self.db.query(WireGuardPeerService)
-                .filter(WireGuardPeerService.name == new_name, WireGuardPeerService.id != service_id)
-                .first()
-            )
-            if existing:
+            if self._exists(WireGuardPeerService.name == new_name, WireGuardPeerService.id != service_id):
                 return {"success": False, "message": f"❌ 对端服务名称 '{new_name}' 已被使用"}
 
         # 保存更新前的数据
         before_data = self._model_to_dict(service)
 
-        # 更新字段
+        # 更新字段（只修改值实际发生变化的列）
         update_fields = []
-        if new_name:
+        provided = bool(new_name)
+        if new_name and new_name != service.name:
             service.name = new_name
             update_fields.append("名称")
-        if "public_key" in args:
-            service.public_key = args["public_key"]
-            update_fields.append("公钥")
-        if "endpoint" in args:
-            service.endpoint = args["endpoint"]
-            update_fields.append("端点")
-        if "allowed_ips" in args:
-            service.allowed_ips = args["allowed_ips"]
-            update_fields.append("允许 IP")
-        if "preshared_key" in args:
-            service.preshared_key = args["preshared_key"]
-            update_fields.append("预共享密钥")
-        if "keepalive" in args:
-            service.keepalive = args["keepalive"]
-            update_fields.append("保持连接")
-        if "description" in args:
-            service.description = args["description"]
-            update_fields.append("描述")
-
-        if not update_fields:
+        for field, label in _WG_PEER_FIELDS:
+            if field in args:
+                provided = True
+                if getattr(service, field) != args[field]:
+                    setattr(service, field, args[field])
+                    update_fields.append(label)
+
+        if not provided:
             return {"success": False, "message": "❌ 未提供任何要更新的字段"}
+        if not update_fields:
+            return {
+                "success": True,
+                "message": f"✅ WireGuard 对端服务 '{service.name}' 没有变化，无需更新",
+                "data": {"id": service.id, "name": service.name}
+            }
 
-        self.db.commit()
-        self.db.refresh(service)
+        self.db.flush()
 
         # 保存版本记录
         self._save_version(
@@ -1312,13 +1642,18 @@ class ToolExecutor:
         if not service_id:
             return {"success": False, "message": "❌ 缺少 service_id 参数"}
 
-        service = self.db.query(WireGuardPeerService).filter(WireGuardPeerService.id == service_id).first()
+        service = self.db.execute(_WG_PEER_SERVICE_BY_ID, {"id": service_id}).scalar_one_or_none()
         if not service:
             return {"success": False, "message": f"❌ 对端服务 ID {service_id} 不存在"}
 
         # 检查是否有 WireGuard 配置在使用
-        configs_using = self.db.query(WireGuardConfig).filter(WireGuardConfig.peer_service_id == service_id).count()
-        if configs_using > 0:
+        if self._exists(WireGuardConfig.peer_service_id == service_id):
+            # 只有确实被引用时才统计具体数量用于提示
+            configs_using = (
+                self.db.query(func.count(WireGuardConfig.id))
+                .filter(WireGuardConfig.peer_service_id == service_id)
+                .scalar()
+            )
             return {
                 "success": False,
                 "message": f"❌ 无法删除：有 {configs_using} 个 WireGuard 配置正在使用此对端服务"
@@ -1329,7 +1664,6 @@ class ToolExecutor:
         service_name = service.name
 
         self.db.delete(service)
-        self.db.commit()
 
         # 保存版本记录
         self._save_version(
@@ -1361,21 +1695,16 @@ class ToolExecutor:
             return {"success": False, "message": "❌ 缺少必要参数: peer_service_id, section_name, private_key, self_ip"}
 
         # 检查对端服务是否存在
-        peer_service = self.db.query(WireGuardPeerService).filter(WireGuardPeerService.id == peer_service_id).first()
+        peer_service = self.db.execute(_WG_PEER_SERVICE_BY_ID, {"id": peer_service_id}).scalar_one_or_none()
         if not peer_service:
             return {"success": False, "message": f"❌ 对端服务 ID {peer_service_id} 不存在"}
 
         # 检查 section_name 是否已存在
-        existing = (
-            self.db.query(WireGuardConfig)
-            .filter(WireGuardConfig.device_id.is_(None), WireGuardConfig.section_name == section_name)
-            .first()
-        )
-        if existing:
+        if self._exists(_WG_GLOBAL_FILTER, WireGuardConfig.section_name == section_name):
             return {"success": False, "message": f"❌ WireGuard 配置 '{section_name}' 已存在"}
 
         # 获取当前最大排序值
-        max_order = self.db.query(WireGuardConfig).filter(WireGuardConfig.device_id.is_(None)).count()
+        max_order = self._next_sort_order(WireGuardConfig, _WG_GLOBAL_FILTER)
 
         config = WireGuardConfig(
             device_id=None,
@@ -1390,8 +1719,12 @@ class ToolExecutor:
             sort_order=max_order,
         )
         self.db.add(config)
-        self.db.commit()
-        self.db.refresh(config)
+        try:
+            self.db.flush()
+        except IntegrityError:
+            # 并发创建同名配置时由数据库唯一约束兜底
+            self.db.rollback()
+            return {"success": False, "message": f"❌ WireGuard 配置 '{section_name}' 已存在"}
 
         # 保存版本记录
         self._save_version(
@@ -1412,32 +1745,38 @@ class ToolExecutor:
         """列出 WireGuard 配置"""
         keyword = args.get("keyword", "").lower()
 
-        configs = (
-            self.db.query(WireGuardConfig)
-            .filter(WireGuardConfig.device_id.is_(None))
-            .order_by(WireGuardConfig.sort_order)
-            .all()
+        # 关联的对端服务名称通过 LEFT JOIN 一次查出，避免逐条查询；关键词过滤下推到数据库
+        query = (
+            self.db.query(
+                WireGuardConfig.id,
+                WireGuardConfig.section_name,
+                WireGuardConfig.self_ip,
+                WireGuardPeerService.name.label("peer_name"),
+            )
+            .outerjoin(WireGuardPeerService, WireGuardPeerService.id == WireGuardConfig.peer_service_id)
+            .filter(_WG_GLOBAL_FILTER)
         )
-
         if keyword:
-            configs = [
-                c for c in configs
-                if keyword in c.section_name.lower() or keyword in (c.description or "").lower()
-            ]
+            search_pattern = f"%{keyword}%"
+            query = query.filter(
+                (func.lower(WireGuardConfig.section_name).like(search_pattern)) |
+                (func.lower(WireGuardConfig.description).like(search_pattern))
+            )
+
+        configs = query.order_by(WireGuardConfig.sort_order).all()
 
         if not configs:
             return {"success": True, "message": "📋 未找到 WireGuard 配置", "data": []}
 
-        config_info = []
-        for c in configs:
-            # 获取关联的对端服务名称
-            peer_service = self.db.query(WireGuardPeerService).filter(WireGuardPeerService.id == c.peer_service_id).first()
-            config_info.append({
+        config_info = [
+            {
                 "id": c.id,
                 "section_name": c.section_name,
                 "self_ip": c.self_ip,
-                "peer_service": peer_service.name if peer_service else "未知"
-            })
+                "peer_service": c.peer_name or "未知"
+            }
+            for c in configs
+        ]
 
         return {
             "success": True,
@@ -1451,61 +1790,46 @@ class ToolExecutor:
         if not config_id:
             return {"success": False, "message": "❌ 缺少 config_id 参数"}
 
-        config = (
-            self.db.query(WireGuardConfig)
-            .filter(WireGuardConfig.id == config_id, WireGuardConfig.device_id.is_(None))
-            .first()
-        )
+        config = self.db.execute(_WG_CONFIG_BY_ID, {"id": config_id}).scalar_one_or_none()
         if not config:
             return {"success": False, "message": f"❌ WireGuard 配置 ID {config_id} 不存在"}
 
         # 检查 section_name 冲突
         new_section_name = args.get("section_name")
         if new_section_name and new_section_name != config.section_name:
-            existing = (
-                self.db.query(WireGuardConfig)
-                .filter(
-                    WireGuardConfig.device_id.is_(None),
-                    WireGuardConfig.section_name == new_section_name,
-                    WireGuardConfig.id != config_id
-                )
-                .first()
-            )
-            if existing:
+            if self._exists(
+                _WG_GLOBAL_FILTER,
+                WireGuardConfig.section_name == new_section_name,
+                WireGuardConfig.id != config_id
+            ):
                 return {"success": False, "message": f"❌ WireGuard 配置名称 '{new_section_name}' 已被使用"}
 
         # 保存更新前的数据
         before_data = self._model_to_dict(config)
 
-        # 更新字段
+        # 更新字段（只修改值实际发生变化的列）
         update_fields = []
-        if new_section_name:
+        provided = bool(new_section_name)
+        if new_section_name and new_section_name != config.section_name:
             config.section_name = new_section_name
             update_fields.append("节名称")
-        if "private_key" in args:
-            config.private_key = args["private_key"]
-            update_fields.append("私钥")
-        if "self_ip" in args:
-            config.self_ip = args["self_ip"]
-            update_fields.append("本地 IP")
-        if "self_ip_v6" in args:
-            config.self_ip_v6 = args["self_ip_v6"]
-            update_fields.append("本地 IPv6")
-        if "dns_server" in args:
-            config.dns_server = args["dns_server"]
-            update_fields.append("DNS")
-        if "mtu" in args:
-            config.mtu = args["mtu"]
-            update_fields.append("MTU")
-        if "description" in args:
-            config.description = args["description"]
-            update_fields.append("描述")
-
-        if not update_fields:
+        for field, label in _WG_CONFIG_FIELDS:
+            if field in args:
+                provided = True
+                if getattr(config, field) != args[field]:
+                    setattr(config, field, args[field])
+                    update_fields.append(label)
+
+        if not provided:
             return {"success": False, "message": "❌ 未提供任何要更新的字段"}
+        if not update_fields:
+            return {
+                "success": True,
+                "message": f"✅ WireGuard 配置 '{config.section_name}' 没有变化，无需更新",
+                "data": {"id": config.id, "section_name": config.section_name}
+            }
 
-        self.db.commit()
-        self.db.refresh(config)
+        self.db.flush()
 
         # 保存版本记录
         self._save_version(
@@ -1528,11 +1852,7 @@ class ToolExecutor:
         if not config_id:
             return {"success": False, "message": "❌ 缺少 config_id 参数"}
 
-        config = (
-            self.db.query(WireGuardConfig)
-            .filter(WireGuardConfig.id == config_id, WireGuardConfig.device_id.is_(None))
-            .first()
-        )
+        config = self.db.execute(_WG_CONFIG_BY_ID, {"id": config_id}).scalar_one_or_none()
         if not config:
             return {"success": False, "message": f"❌ WireGuard 配置 ID {config_id} 不存在"}
 
@@ -1541,7 +1861,6 @@ class ToolExecutor:
         section_name = config.section_name
 
         self.db.delete(config)
-        self.db.commit()
 
         # 保存版本记录
         self._save_version(
@@ -1610,10 +1929,13 @@ class ToolExecutor:
     def _handle_rollback_config(self, args: dict[str, Any]) -> dict[str, Any]:
         """回滚配置到指定版本"""
         version_id = args.get("version_id")
+        version_ids = args.get("version_ids")
         confirm = args.get("confirm", False)
 
+        if version_ids:
+            return self._rollback_versions(version_ids, confirm)
         if not version_id:
-            return {"success": False, "message": "❌ 缺少 version_id 参数"}
+            return {"success": False, "message": "❌ 缺少 version_id 或 version_ids 参数"}
 
         # 查找版本记录
         version = self.db.query(ConfigVersion).filter(ConfigVersion.id == version_id).first()
@@ -1644,17 +1966,7 @@ class ToolExecutor:
 
         try:
             # 根据资源类型查找对应的模型
-            model_map = {
-                "rule": RuleConfig,
-                "proxy": ProxyConfig,
-                "proxy_group": ProxyGroupConfig,
-                "host": HostConfig,
-                "general_config": GeneralConfig,
-                "wireguard_config": WireGuardConfig,
-                "wireguard_peer_service": WireGuardPeerService,
-            }
-
-            model_class = model_map.get(resource_type)
+            model_class = _VERSIONED_MODELS.get(resource_type)
             if not model_class:
                 return {"success": False, "message": f"❌ 不支持的资源类型: {resource_type}"}
 
@@ -1666,16 +1978,15 @@ class ToolExecutor:
                 if obj:
                     return {"success": False, "message": f"❌ 资源已存在，无法恢复删除的数据（ID {resource_id} 已被占用）"}
 
-                # 重新创建对象
-                new_obj = model_class(**restore_data)
-                self.db.add(new_obj)
-                self.db.commit()
-                self.db.refresh(new_obj)
+                # 重新插入被删除的数据（批量插入接口，不构造 ORM 实例）
+                row = dict(restore_data)
+                self.db.bulk_insert_mappings(model_class, [row], return_defaults=True)
+                new_id = row["id"]
 
                 # 保存回滚操作的版本记录
                 self._save_version(
                     resource_type=resource_type,
-                    resource_id=new_obj.id,
+                    resource_id=new_id,
                     operation_type="rollback",
                     before_data=None,
                     after_data=restore_data
@@ -1683,8 +1994,8 @@ class ToolExecutor:
 
                 return {
                     "success": True,
-                    "message": f"✅ 成功恢复已删除的 {resource_type} (ID {new_obj.id})",
-                    "data": {"id": new_obj.id, "restored_data": restore_data}
+                    "message": f"✅ 成功恢复已删除的 {resource_type} (ID {new_id})",
+                    "data": {"id": new_id, "restored_data": restore_data}
                 }
 
             elif obj:
@@ -1695,8 +2006,7 @@ class ToolExecutor:
                         current_data[key] = getattr(obj, key)
                         setattr(obj, key, value)
 
-                self.db.commit()
-                self.db.refresh(obj)
+                self.db.flush()
 
                 # 保存回滚操作的版本记录
                 self._save_version(
@@ -1720,152 +2030,240 @@ class ToolExecutor:
             logger.error(f"回滚配置失败: {e}", exc_info=True)
             return {"success": False, "message": f"❌ 回滚失败: {str(e)}"}
 
+    def _rollback_versions(self, version_ids: list[int], confirm: bool) -> dict[str, Any]:
+        """批量回滚多个版本（按模型分组，批量插入/批量更新）"""
+        versions = (
+            self.db.query(ConfigVersion)
+            .filter(ConfigVersion.id.in_(version_ids))
+            .order_by(ConfigVersion.id)
+            .all()
+        )
+        missing = set(version_ids) - {v.id for v in versions}
+        if missing:
+            return {"success": False, "message": f"❌ 版本记录 ID {', '.join(map(str, sorted(missing)))} 不存在"}
+
+        # 危险操作确认
+        if not confirm:
+            return {
+                "success": False,
+                "message": f"⚠️ 这是危险操作！将批量回滚 {len(versions)} 个版本。请添加 confirm=True 参数确认。",
+                "data": {
+                    "versions": [
+                        {
+                            "version_id": v.id,
+                            "resource_type": v.resource_type,
+                            "resource_id": v.resource_id,
+                            "operation": v.operation_type,
+                        }
+                        for v in versions
+                    ]
+                }
+            }
+
+        # 按模型分组：删除操作重新插入，创建/更新操作恢复字段
+        inserts: dict[type, list[ConfigVersion]] = {}
+        updates: dict[type, list[ConfigVersion]] = {}
+        for v in versions:
+            if not v.before_data:
+                return {"success": False, "message": f"❌ 版本 {v.id} 没有可恢复的数据（before_data 为空）"}
+            model_class = _VERSIONED_MODELS.get(v.resource_type)
+            if not model_class:
+                return {"success": False, "message": f"❌ 不支持的资源类型: {v.resource_type}"}
+            target = inserts if v.operation_type == "delete" else updates
+            target.setdefault(model_class, []).append(v)
+
+        version_records = []
+        try:
+            for model_class, group in inserts.items():
+                occupied = [
+                    resource_id for (resource_id,) in
+                    self.db.query(model_class.id).filter(model_class.id.in_([v.resource_id for v in group]))
+                ]
+                if occupied:
+                    return {
+                        "success": False,
+                        "message": f"❌ 资源已存在，无法恢复删除的数据（ID {', '.join(map(str, occupied))} 已被占用）"
+                    }
+
+                rows = [dict(v.before_data) for v in group]
+                self.db.bulk_insert_mappings(model_class, rows, return_defaults=True)
+                version_records.extend(
+                    (v.resource_type, row["id"], "rollback", None, v.before_data)
+                    for v, row in zip(group, rows)
+                )
+
+            for model_class, group in updates.items():
+                objs = {
+                    obj.id: obj for obj in
+                    self.db.query(model_class).filter(model_class.id.in_([v.resource_id for v in group]))
+                }
+                not_found = [v.resource_id for v in group if v.resource_id not in objs]
+                if not_found:
+                    return {
+                        "success": False,
+                        "message": f"❌ 资源 {group[0].resource_type} ID {', '.join(map(str, not_found))} 不存在，无法回滚"
+                    }
+
+                column_names = {name for name, _ in _columns_of(model_class)}
+                mappings = []
+                for v in group:
+                    current = self._model_to_dict(objs[v.resource_id])
+                    restore = {k: value for k, value in v.before_data.items() if k in column_names and k != "id"}
+                    mappings.append({"id": v.resource_id, **restore})
+                    version_records.append((
+                        v.resource_type, v.resource_id, "rollback",
+                        {k: current[k] for k in restore}, v.before_data,
+                    ))
+                self.db.bulk_update_mappings(model_class, mappings)
+
+            # 保存回滚操作的版本记录
+            self._save_versions(version_records)
+
+        except Exception as e:
+            self.db.rollback()
+            logger.error(f"批量回滚配置失败: {e}", exc_info=True)
+            return {"success": False, "message": f"❌ 批量回滚失败: {str(e)}"}
+
+        return {
+            "success": True,
+            "message": f"✅ 成功回滚 {len(versions)} 个版本",
+            "data": {"version_ids": [v.id for v in versions]}
+        }
+
 
     def get_config_context(self, force_refresh: bool = False) -> str:
         """生成配置上下文摘要，供系统提示词使用（带缓存）"""
         logger.info("get_config_context 开始执行")
-        # 检查缓存
-        now = time.time()
-        if not force_refresh and self._cache_data and (now - self._cache_timestamp) < self.CACHE_TTL:
+        # 检查缓存：本实例的修改计数 + 最新版本记录 ID（其他会话的修改同样会写入版本记录）
+        cache_key = (self._cache_version, self.db.query(func.max(ConfigVersion.id)).scalar())
+        if not force_refresh and self._cache_data and self._cache_key == cache_key:
             logger.info("使用缓存的配置上下文")
             return self._cache_data
 
         logger.info("重新生成配置上下文")
         lines = ["[当前配置概览]"]
 
-        # 规则摘要 + 统计
-        all_rules = (
-            self.db.query(RuleConfig)
-            .filter(RuleConfig.device_id.is_(None))
-            .order_by(RuleConfig.sort_order)
+        # 规则摘要 + 统计（分布统计在数据库中 GROUP BY 完成）
+        total_rules = self.db.query(func.count(RuleConfig.id)).filter(_RULE_GLOBAL_FILTER).scalar()
+
+        rule_type_rows = (
+            self.db.query(RuleConfig.rule_type, func.count())
+            .filter(_RULE_GLOBAL_FILTER)
+            .group_by(RuleConfig.rule_type)
+            .order_by(func.count().desc())
+            .limit(5)
+            .all()
+        )
+        # 策略分布取全部分组：下方“未使用的代理组”检测也需要已使用的策略集合
+        policy_rows = (
+            self.db.query(RuleConfig.policy, func.count())
+            .filter(_RULE_GLOBAL_FILTER)
+            .group_by(RuleConfig.policy)
+            .order_by(func.count().desc())
             .all()
         )
-        total_rules = len(all_rules)
-
-        # 统计规则类型分布
-        rule_type_count = {}
-        policy_count = {}
-        for r in all_rules:
-            rule_type_count[r.rule_type] = rule_type_count.get(r.rule_type, 0) + 1
-            policy_count[r.policy] = policy_count.get(r.policy, 0) + 1
 
         # 规则类型分布（按数量排序）
-        type_dist = ", ".join([f"{k}({v})" for k, v in sorted(rule_type_count.items(), key=lambda x: -x[1])[:5]])
+        type_dist = ", ".join([f"{k}({v})" for k, v in rule_type_rows])
         # 策略分布（按数量排序）
-        policy_dist = ", ".join([f"{k}({v})" for k, v in sorted(policy_count.items(), key=lambda x: -x[1])[:5]])
+        policy_dist = ", ".join([f"{k}({v})" for k, v in policy_rows[:5]])
 
-        lines.append(f"\n规则 (共 {total_rules} 条):")
-        lines.append(f"  类型分布: {type_dist}")
-        lines.append(f"  策略分布: {policy_dist}")
-        lines.append("")
+        lines.extend((
+            f"\n规则 (共 {total_rules} 条):",
+            f"  类型分布: {type_dist}",
+            f"  策略分布: {policy_dist}",
+            "",
+        ))
 
         # 显示前 30 条规则
-        for r in all_rules[:30]:
-            line = f"  [ID:{r.id}] {r.rule_type}, {r.value}, {r.policy}"
-            if r.comment:
-                line += f" // {r.comment}"
-            lines.append(line)
+        preview_rules = (
+            self.db.query(
+                RuleConfig.id, RuleConfig.rule_type, RuleConfig.value, RuleConfig.policy, RuleConfig.comment
+            )
+            .filter(_RULE_GLOBAL_FILTER)
+            .order_by(RuleConfig.sort_order)
+            .limit(30)
+            .all()
+        )
+        # 注释部分直接嵌入同一个 f-string，每条规则只生成一个字符串
+        lines.extend(
+            f"  [ID:{r.id}] {r.rule_type}, {r.value}, {r.policy}{f' // {r.comment}' if r.comment else ''}"
+            for r in preview_rules
+        )
         if total_rules > 30:
             lines.append(f"  ... 还有 {total_rules - 30} 条规则")
 
-        # 策略组摘要 + 统计
+        # 策略组摘要 + 统计（只查询摘要与建议检测需要的列）
         groups = (
-            self.db.query(ProxyGroupConfig)
-            .filter(ProxyGroupConfig.device_id.is_(None))
+            self.db.query(ProxyGroupConfig.name, ProxyGroupConfig.group_type)
+            .filter(_GROUP_GLOBAL_FILTER)
             .all()
         )
 
-        # 统计代理组类型分布
-        group_type_count = {}
-        for g in groups:
-            group_type_count[g.group_type] = group_type_count.get(g.group_type, 0) + 1
-
-        group_type_dist = ", ".join([f"{k}({v})" for k, v in group_type_count.items()])
+        # 统计代理组类型分布（按数量排序）
+        group_type_count = Counter(g.group_type for g in groups)
+        group_type_dist = ", ".join(f"{k}({v})" for k, v in group_type_count.most_common())
 
         lines.append(f"\n策略组 (共 {len(groups)} 个):")
         if group_type_dist:
             lines.append(f"  类型分布: {group_type_dist}")
-        for g in groups:
-            lines.append(f"  - {g.name} ({g.group_type})")
+        lines.extend(f"  - {g.name} ({g.group_type})" for g in groups)
 
-        # 代理摘要 + 统计
+        # 代理摘要 + 统计（只查询名称与协议）
         proxies = (
-            self.db.query(ProxyConfig)
-            .filter(ProxyConfig.device_id.is_(None), ProxyConfig.is_active == True)
+            self.db.query(ProxyConfig.name, ProxyConfig.protocol)
+            .filter(_PROXY_GLOBAL_FILTER, ProxyConfig.is_active == True)
             .all()
         )
 
-        # 统计代理协议分布
-        protocol_count = {}
-        for p in proxies:
-            protocol_count[p.protocol] = protocol_count.get(p.protocol, 0) + 1
-
-        protocol_dist = ", ".join([f"{k}({v})" for k, v in protocol_count.items()])
+        # 统计代理协议分布（按数量排序）
+        protocol_count = Counter(p.protocol for p in proxies)
+        protocol_dist = ", ".join(f"{k}({v})" for k, v in protocol_count.most_common())
 
         lines.append(f"\n代理节点 (共 {len(proxies)} 个):")
         if protocol_dist:
             lines.append(f"  协议分布: {protocol_dist}")
-        for p in proxies[:10]:
-            lines.append(f"  - {p.name} ({p.protocol})")
+        lines.extend(f"  - {p.name} ({p.protocol})" for p in proxies[:10])
         if len(proxies) > 10:
             lines.append(f"  ... 还有 {len(proxies) - 10} 个节点")
 
-        # AI 配置建议检测
-        suggestions = []
-
-        # 检测 1: 冗余规则（相同的 rule_type + value + policy）
-        rule_signatures = {}
-        for r in all_rules:
-            sig = f"{r.rule_type}|{r.value}|{r.policy}"
-            if sig in rule_signatures:
-                rule_signatures[sig].append(r.id)
-            else:
-                rule_signatures[sig] = [r.id]
-
-        duplicates = {sig: ids for sig, ids in rule_signatures.items() if len(ids) > 1}
-        if duplicates:
-            for sig, ids in list(duplicates.items())[:3]:  # 只显示前 3 组
-                suggestions.append(f"⚠️ 冗余规则：规则 {', '.join([f'#{id}' for id in ids])} 完全相同")
-
-        # 检测 2: 未使用的代理组
-        used_policies = set(r.policy for r in all_rules)
-        unused_groups = [g.name for g in groups if g.name not in used_policies]
-        if unused_groups:
-            suggestions.append(f"⚠️ 未使用的代理组：{', '.join(unused_groups[:5])}")
-
-        # 检测 3: FINAL 规则顺序问题
-        final_rules = [r for r in all_rules if r.rule_type == "FINAL"]
-        if final_rules:
-            final_rule = final_rules[0]
-            # 检查 FINAL 是否在最后
-            if all_rules and all_rules[-1].id != final_rule.id:
-                last_rule_idx = all_rules.index(final_rule) if final_rule in all_rules else -1
-                if last_rule_idx >= 0 and last_rule_idx < len(all_rules) - 1:
-                    rules_after = len(all_rules) - last_rule_idx - 1
-                    suggestions.append(f"⚠️ 规则顺序：FINAL 规则（#{final_rule.id}）应该在最后，但后面还有 {rules_after} 条规则")
-
-        # 检测 4: 未使用的代理节点
-        used_proxy_names = set()
-        for g in groups:
-            used_proxy_names.update(g.members)
-        unused_proxies = [p.name for p in proxies if p.name not in used_proxy_names]
-        if unused_proxies and len(unused_proxies) <= 5:
-            suggestions.append(f"⚠️ 未使用的代理节点：{', '.join(unused_proxies)}")
+        # AI 配置建议检测（只查询检测需要的列）
+        all_rules = (
+            self.db.query(RuleConfig.id, RuleConfig.rule_type, RuleConfig.value, RuleConfig.policy)
+            .filter(_RULE_GLOBAL_FILTER)
+            .order_by(RuleConfig.sort_order)
+            .all()
+        )
+        # 未被引用的代理节点最多取 6 个：超过 5 个时不提示
+        suggestions = _build_suggestions(
+            all_rules, {policy for policy, _ in policy_rows}, groups, lambda: self._unused_proxy_names(limit=6)
+        )
 
         # 添加建议到输出
         if suggestions:
-            lines.append("\n[配置建议]")
-            lines.append(f"发现 {len(suggestions)} 个潜在问题：")
-            for suggestion in suggestions[:5]:  # 最多显示 5 条建议
-                lines.append(f"  {suggestion}")
+            lines.extend(("\n[配置建议]", f"发现 {len(suggestions)} 个潜在问题："))
+            lines.extend(f"  {suggestion}" for suggestion in suggestions[:_SUGGESTION_LIMIT])
 
         # 更新缓存
         context = "\n".join(lines)
         self._cache_data = context
-        self._cache_timestamp = time.time()
+        self._cache_key = cache_key
 
         return context
 
+    def cached_prompt(self, config_context: str, render: Callable[[str], str]) -> str:
+        """返回基于配置上下文渲染的系统提示词
+
+        get_config_context 命中缓存时返回的是同一个对象，此时直接复用上次渲染的结果；
+        配置变更后上下文重新生成，提示词随之重新渲染。
+        """
+        cached = self._prompt_cache
+        if cached is not None and cached[0] is config_context:
+            return cached[1]
+        prompt = render(config_context)
+        self._prompt_cache = (config_context, prompt)
+        return prompt
+
     # ============ 规则集管理 ============
 
     def _handle_create_ruleset(self, args: dict[str, Any]) -> dict[str, Any]:
@@ -1878,12 +2276,11 @@ class ToolExecutor:
             return {"success": False, "message": "❌ 缺少必要参数: name"}
 
         # 检查名称唯一性
-        existing = self.db.query(RuleSet).filter(RuleSet.name == name).first()
-        if existing:
+        if self._exists(RuleSet.name == name):
             return {"success": False, "message": f"❌ 规则集名称 '{name}' 已存在"}
 
         # 获取最大排序值
-        max_order = self.db.query(RuleSet).count()
+        max_order = self._next_sort_order(RuleSet)
 
         # 创建规则集
         ruleset = RuleSet(
@@ -1894,21 +2291,20 @@ class ToolExecutor:
         self.db.add(ruleset)
         self.db.flush()
 
-        # 添加初始条目
-        added_items = []
-        for idx, item_data in enumerate(items):
-            item = RuleSetItem(
-                ruleset_id=ruleset.id,
-                item_type=item_data.get("item_type"),
-                value=item_data.get("value"),
-                comment=item_data.get("comment", ""),
-                sort_order=idx,
-            )
-            self.db.add(item)
-            added_items.append(f"{item.item_type}: {item.value}")
-
-        self.db.commit()
-        self.db.refresh(ruleset)
+        # 添加初始条目（一次多行 INSERT）
+        rows = [
+            {
+                "ruleset_id": ruleset.id,
+                "item_type": item_data.get("item_type"),
+                "value": item_data.get("value"),
+                "comment": item_data.get("comment", ""),
+                "sort_order": idx,
+            }
+            for idx, item_data in enumerate(items)
+        ]
+        if rows:
+            self.db.execute(insert(RuleSetItem), rows)
+        added_items = [f"{row['item_type']}: {row['value']}" for row in rows]
 
         result_msg = f"✅ 成功创建规则集 '{name}'"
         if added_items:
@@ -1920,21 +2316,38 @@ class ToolExecutor:
             "data": {
                 "id": ruleset.id,
                 "name": ruleset.name,
+                "description": ruleset.description,
                 "item_count": len(added_items)
             }
         }
 
+    def _ruleset_item_counts(self, ruleset_ids: list[int]) -> dict[int, tuple[int, int]]:
+        """统计规则集的条目数：{ruleset_id: (条目总数, 启用条目数)}（单条 GROUP BY 查询）"""
+        rows = (
+            self.db.query(
+                RuleSetItem.ruleset_id,
+                func.count(RuleSetItem.id),
+                func.sum(case((RuleSetItem.is_active == True, 1), else_=0)),
+            )
+            .filter(RuleSetItem.ruleset_id.in_(ruleset_ids))
+            .group_by(RuleSetItem.ruleset_id)
+        )
+        return {ruleset_id: (total, active or 0) for ruleset_id, total, active in rows}
+
     def _handle_list_rulesets(self, args: dict[str, Any]) -> dict[str, Any]:
         """查询规则集列表"""
         keyword = args.get("keyword", "").lower()
+        active_only = args.get("active_only", False)
 
-        query = self.db.query(RuleSet)
+        query = self.db.query(RuleSet).options(*_list_load_options())
 
+        if active_only:
+            query = query.filter(RuleSet.is_active == True)
         if keyword:
             search_pattern = f"%{keyword}%"
             query = query.filter(
-                (RuleSet.name.like(search_pattern)) |
-                (RuleSet.description.like(search_pattern))
+                (RuleSet.name.ilike(search_pattern)) |
+                (RuleSet.description.ilike(search_pattern))
             )
 
         rulesets = query.order_by(RuleSet.sort_order).all()
@@ -1942,10 +2355,16 @@ class ToolExecutor:
         if not rulesets:
             return {"success": True, "message": "📋 暂无规则集", "data": []}
 
+        item_counts = self._ruleset_item_counts([rs.id for rs in rulesets])
+        lines = [f"📋 共 {len(rulesets)} 个规则集：", ""]
         data = []
         for rs in rulesets:
-            item_count = len(rs.items)
-            active_count = len([i for i in rs.items if i.is_active])
+            item_count, active_count = item_counts.get(rs.id, (0, 0))
+            status = "" if rs.is_active else " [已禁用]"
+            lines.append(f"#{rs.id}  {rs.name} ({item_count} 条){status}")
+            if rs.description:
+                lines.append(f"    💬 {rs.description}")
+            lines.append("")
             data.append({
                 "id": rs.id,
                 "name": rs.name,
@@ -1957,7 +2376,7 @@ class ToolExecutor:
 
         return {
             "success": True,
-            "message": f"📋 共 {len(rulesets)} 个规则集",
+            "message": "\n".join(lines),
             "data": data
         }
 
@@ -1969,10 +2388,12 @@ class ToolExecutor:
         if not ruleset_id and not name:
             return {"success": False, "message": "❌ 需要提供 ruleset_id 或 name"}
 
+        # 条目随规则集一起以 SELECT ... IN 预加载，避免访问 items 时再触发懒加载
+        query = self.db.query(RuleSet).options(selectinload(RuleSet.items))
         if ruleset_id:
-            ruleset = self.db.query(RuleSet).filter(RuleSet.id == ruleset_id).first()
+            ruleset = query.filter(RuleSet.id == ruleset_id).first()
         else:
-            ruleset = self.db.query(RuleSet).filter(RuleSet.name == name).first()
+            ruleset = query.filter(RuleSet.name == name).first()
 
         if not ruleset:
             return {"success": False, "message": "❌ 规则集不存在"}
@@ -2016,11 +2437,7 @@ class ToolExecutor:
         # 更新名称
         new_name = args.get("name")
         if new_name and new_name != ruleset.name:
-            existing = self.db.query(RuleSet).filter(
-                RuleSet.name == new_name,
-                RuleSet.id != ruleset_id
-            ).first()
-            if existing:
+            if self._exists(RuleSet.name == new_name, RuleSet.id != ruleset_id):
                 return {"success": False, "message": f"❌ 规则集名称 '{new_name}' 已存在"}
             ruleset.name = new_name
             updated_fields.append("名称")
@@ -2038,9 +2455,6 @@ class ToolExecutor:
         if not updated_fields:
             return {"success": False, "message": "❌ 未提供任何要更新的字段"}
 
-        self.db.commit()
-        self.db.refresh(ruleset)
-
         return {
             "success": True,
             "message": f"✅ 规则集已更新: {', '.join(updated_fields)}",
@@ -2059,10 +2473,12 @@ class ToolExecutor:
             return {"success": False, "message": "❌ 规则集不存在"}
 
         name = ruleset.name
-        item_count = len(ruleset.items)
+        # 显式批量删除条目（不依赖级联），删除行数即条目数，无需加载全部条目
+        item_count = self.db.query(RuleSetItem).filter(
+            RuleSetItem.ruleset_id == ruleset.id
+        ).delete()
 
         self.db.delete(ruleset)
-        self.db.commit()
 
         return {
             "success": True,
@@ -2095,33 +2511,58 @@ class ToolExecutor:
         if not ruleset:
             return {"success": False, "message": f"❌ 规则集不存在: {ruleset_name or ruleset_id}"}
 
-        # 获取当前最大排序值
-        current_count = len(ruleset.items)
-
-        added = []
-        for idx, item_data in enumerate(items):
+        # 有效条目按 (item_type, value) 去重，保留首次出现的顺序
+        candidates: dict[tuple[str, str], dict] = {}
+        for item_data in items:
             item_type = item_data.get("item_type")
             value = item_data.get("value")
+            if item_type and value:
+                candidates.setdefault((item_type, value), item_data)
+
+        # 一次查询找出规则集中已存在的条目
+        existing = set()
+        if candidates:
+            existing = {
+                (item_type, value)
+                for item_type, value in self.db.query(RuleSetItem.item_type, RuleSetItem.value).filter(
+                    RuleSetItem.ruleset_id == ruleset.id,
+                    tuple_(RuleSetItem.item_type, RuleSetItem.value).in_(list(candidates)),
+                )
+            }
+        new_items = [(key, item_data) for key, item_data in candidates.items() if key not in existing]
 
-            if not item_type or not value:
-                continue
+        # 获取下一个排序值（MAX + 1，不加载全部条目）
+        current_count = self._next_sort_order(RuleSetItem, RuleSetItem.ruleset_id == ruleset.id)
 
-            item = RuleSetItem(
-                ruleset_id=ruleset.id,  # 使用查询到的 ruleset.id，而不是传入参数
-                item_type=item_type,
-                value=value,
-                comment=item_data.get("comment", ""),
-                sort_order=current_count + idx,
-            )
-            self.db.add(item)
-            added.append(f"{item_type}: {value}")
+        rows = [
+            {
+                "ruleset_id": ruleset.id,  # 使用查询到的 ruleset.id，而不是传入参数
+                "item_type": item_type,
+                "value": value,
+                "comment": item_data.get("comment", ""),
+                "sort_order": current_count + idx,
+            }
+            for idx, ((item_type, value), item_data) in enumerate(new_items)
+        ]
+        added = [f"{item_type}: {value}" for (item_type, value), _ in new_items]
 
-        self.db.commit()
+        # 一次多行 INSERT 写入全部条目
+        if rows:
+            self.db.execute(insert(RuleSetItem), rows)
+
+        message = f"✅ 向规则集 '{ruleset.name}' 添加了 {len(added)} 个条目"
+        if existing:
+            message += f"，跳过 {len(existing)} 个已存在的条目"
 
         return {
             "success": True,
-            "message": f"✅ 向规则集 '{ruleset.name}' 添加了 {len(added)} 个条目",
-            "data": {"ruleset_id": ruleset.id, "added_count": len(added), "items": added}
+            "message": message,
+            "data": {
+                "ruleset_id": ruleset.id,
+                "added_count": len(added),
+                "skipped_count": len(existing),
+                "items": added,
+            }
         }
 
     def _handle_delete_ruleset_item(self, args: dict[str, Any]) -> dict[str, Any]:
@@ -2142,7 +2583,6 @@ class ToolExecutor:
 
         item_info = f"{item.item_type}: {item.value}"
         self.db.delete(item)
-        self.db.commit()
 
         return {
             "success": True,
@@ -2205,11 +2645,7 @@ class ToolExecutor:
 
             # 3. 创建 WireGuard 配置
             section_name = name
-            existing_config = self.db.query(WireGuardConfig).filter(
-                WireGuardConfig.section_name == section_name
-            ).first()
-
-            if existing_config:
+            if self._exists(WireGuardConfig.section_name == section_name):
                 results.append(f"⚠️ WireGuard 配置 '{section_name}' 已存在")
             else:
                 wg_config = WireGuardConfig(
@@ -2229,11 +2665,7 @@ class ToolExecutor:
             # 4. 创建 WireGuard 代理节点（可选）
             if device_id:
                 proxy_name = f"{name}-Proxy"
-                existing_proxy = self.db.query(ProxyConfig).filter(
-                    ProxyConfig.name == proxy_name
-                ).first()
-
-                if not existing_proxy:
+                if not self._exists(ProxyConfig.name == proxy_name):
                     proxy = ProxyConfig(
                         name=proxy_name,
                         protocol="wireguard",
@@ -2244,8 +2676,7 @@ class ToolExecutor:
                     self.db.add(proxy)
                     results.append(f"✅ 创建代理节点: {proxy_name}")
 
-            self.db.commit()
-
+            # 由 execute() 统一提交：三步写入同属一个事务，仅在需要 peer_service.id 时 flush
             return {
                 "success": True,
                 "message": "\n".join(results),
@@ -2262,8 +2693,6 @@ class ToolExecutor:
 
     def _handle_extract_to_ruleset(self, args: dict[str, Any]) -> dict[str, Any]:
         """从现有规则中提取 IP/域名，添加到指定规则集"""
-        import re
-
         policy = args.get("policy")
         ruleset_name = args.get("ruleset_name")
         include_types = args.get("include_types", [
@@ -2278,15 +2707,21 @@ class ToolExecutor:
         if not ruleset:
             return {"success": False, "message": f"❌ 规则集 '{ruleset_name}' 不存在"}
 
-        # 查询指定策略的规则
-        rules = self.db.query(RuleConfig).filter(
-            RuleConfig.device_id.is_(None),
+        # 查询指定策略的规则（只取解析需要的列）
+        rules = self.db.query(RuleConfig.id, RuleConfig.rule_type, RuleConfig.value).filter(
+            _RULE_GLOBAL_FILTER,
             RuleConfig.policy.ilike(f"%{policy}%")
         ).all()
 
         if not rules:
             return {"success": False, "message": f"❌ 未找到策略为 '{policy}' 的规则"}
 
+        # 复合规则内部值的匹配模式: (类型,值) 或 (类型,值,选项)；所有类型合并为一个正则，只编译一次
+        type_order = {t.upper(): (idx, t) for idx, t in enumerate(include_types)}
+        compound_pattern = re.compile(
+            rf'\(({"|".join(map(re.escape, include_types))}),([^,\)]+)', re.IGNORECASE
+        ) if include_types else None
+
         # 解析规则中的值
         extracted_items = []
 
@@ -2303,20 +2738,19 @@ class ToolExecutor:
                 })
 
             # 复合规则（AND/OR）需要解析内部值
-            elif rule_type in ("AND", "OR"):
-                # 使用正则表达式提取各种类型的值
-                for item_type in include_types:
-                    # 匹配模式: (类型,值) 或 (类型,值,选项)
-                    pattern = rf'\({item_type},([^,\)]+)'
-                    matches = re.findall(pattern, value, re.IGNORECASE)
-                    for match in matches:
-                        extracted_value = match.strip()
-                        if extracted_value:
-                            extracted_items.append({
-                                "item_type": item_type,
-                                "value": extracted_value,
-                                "comment": f"从规则 #{rule.id} ({rule_type}) 提取"
-                            })
+            elif rule_type in ("AND", "OR") and compound_pattern:
+                # 一次扫描提取各种类型的值，再按 include_types 的顺序排列（与逐类型匹配的结果顺序一致）
+                matches = sorted(
+                    ((type_order[m.group(1).upper()], m.group(2).strip()) for m in compound_pattern.finditer(value)),
+                    key=lambda match: match[0],
+                )
+                for (_, item_type), extracted_value in matches:
+                    if extracted_value:
+                        extracted_items.append({
+                            "item_type": item_type,
+                            "value": extracted_value,
+                            "comment": f"从规则 #{rule.id} ({rule_type}) 提取"
+                        })
 
         if not extracted_items:
             return {
@@ -2333,11 +2767,11 @@ class ToolExecutor:
                 seen.add(key)
                 unique_items.append(item)
 
-        # 检查现有条目，避免重复添加
-        existing_items = self.db.query(RuleSetItem).filter(
+        # 检查现有条目，避免重复添加（只查询去重需要的两列）
+        existing_items = self.db.query(RuleSetItem.item_type, RuleSetItem.value).filter(
             RuleSetItem.ruleset_id == ruleset.id
         ).all()
-        existing_set = {(i.item_type, i.value) for i in existing_items}
+        existing_set = {(item_type, value) for item_type, value in existing_items}
 
         # 过滤掉已存在的条目
         new_items = [
@@ -2352,22 +2786,21 @@ class ToolExecutor:
                 "data": {"extracted_count": len(unique_items), "added_count": 0}
             }
 
-        # 添加新条目
+        # 添加新条目（一次多行 INSERT，由 execute() 统一提交）
         current_max_order = len(existing_items)
-        added = []
-        for idx, item_data in enumerate(new_items):
-            item = RuleSetItem(
-                ruleset_id=ruleset.id,
-                item_type=item_data["item_type"],
-                value=item_data["value"],
-                comment=item_data.get("comment"),
-                is_active=True,
-                sort_order=current_max_order + idx
-            )
-            self.db.add(item)
-            added.append(f"{item_data['item_type']}: {item_data['value']}")
-
-        self.db.commit()
+        rows = [
+            {
+                "ruleset_id": ruleset.id,
+                "item_type": item_data["item_type"],
+                "value": item_data["value"],
+                "comment": item_data.get("comment"),
+                "is_active": True,
+                "sort_order": current_max_order + idx,
+            }
+            for idx, item_data in enumerate(new_items)
+        ]
+        self.db.execute(insert(RuleSetItem), rows)
+        added = [f"{row['item_type']}: {row['value']}" for row in rows]
 
         return {
             "success": True,
@@ -2387,10 +2820,7 @@ class ToolExecutor:
         if not host_id:
             return {"success": False, "message": "❌ 缺少 host_id 参数"}
 
-        host = self.db.query(HostConfig).filter(
-            HostConfig.id == host_id,
-            HostConfig.device_id.is_(None)
-        ).first()
+        host = self.db.execute(_HOST_BY_ID, {"id": host_id}).scalar_one_or_none()
 
         if not host:
             return {"success": False, "message": f"❌ 主机映射 ID {host_id} 不存在"}
@@ -2409,8 +2839,7 @@ class ToolExecutor:
         if not update_fields:
             return {"success": False, "message": "❌ 未提供任何要更新的字段"}
 
-        self.db.commit()
-        self.db.refresh(host)
+        self.db.flush()
 
         # 保存版本记录
         self._save_version(
@@ -2439,7 +2868,7 @@ class ToolExecutor:
             return {"success": False, "message": "❌ 缺少 key 参数"}
 
         config = self.db.query(GeneralConfig).filter(
-            GeneralConfig.device_id.is_(None),
+            _GEN_GLOBAL_FILTER,
             GeneralConfig.key == key
         ).first()
 
@@ -2451,7 +2880,6 @@ class ToolExecutor:
         config_id = config.id
 
         self.db.delete(config)
-        self.db.commit()
 
         # 保存版本记录
         self._save_version(
@@ -2468,12 +2896,13 @@ class ToolExecutor:
         """获取设备列表"""
         keyword = args.get("keyword", "").lower()
 
-        devices = self.db.query(Device).filter(
+        query = self.db.query(Device).options(*_list_load_options()).filter(
             Device.user_id == self.current_user.id
-        ).all()
-
+        )
+        # 关键词过滤下推到数据库（不区分大小写）
         if keyword:
-            devices = [d for d in devices if keyword in d.name.lower()]
+            query = query.filter(Device.name.ilike(f"%{keyword}%"))
+        devices = query.all()
 
         if not devices:
             return {"success": True, "message": "暂无设备", "data": []}
@@ -2507,18 +2936,11 @@ class ToolExecutor:
             return {"success": False, "message": "❌ 缺少 key 或 value 参数"}
 
         # 检查是否已存在
-        existing = self.db.query(GeneralConfig).filter(
-            GeneralConfig.device_id.is_(None),
-            GeneralConfig.key == key
-        ).first()
-
-        if existing:
+        if self._exists(_GEN_GLOBAL_FILTER, GeneralConfig.key == key):
             return {"success": False, "message": f"❌ 配置项 '{key}' 已存在，请使用 update_general_config 更新"}
 
         # 获取当前最大排序值
-        max_order = self.db.query(GeneralConfig).filter(
-            GeneralConfig.device_id.is_(None)
-        ).count()
+        max_order = self._next_sort_order(GeneralConfig, _GEN_GLOBAL_FILTER)
 
         config = GeneralConfig(
             device_id=None,
@@ -2528,8 +2950,7 @@ class ToolExecutor:
             sort_order=max_order,
         )
         self.db.add(config)
-        self.db.commit()
-        self.db.refresh(config)
+        self.db.flush()
 
         # 保存版本记录
         self._save_version(
@@ -2559,12 +2980,7 @@ class ToolExecutor:
             return {"success": False, "message": "❌ 缺少设备名称"}
 
         # 检查名称是否已存在
-        existing = self.db.query(Device).filter(
-            Device.user_id == self.current_user.id,
-            Device.name == name
-        ).first()
-
-        if existing:
+        if self._exists(Device.user_id == self.current_user.id, Device.name == name):
             return {"success": False, "message": f"❌ 设备 '{name}' 已存在"}
 
         device = Device(
@@ -2573,8 +2989,7 @@ class ToolExecutor:
             description=description,
         )
         self.db.add(device)
-        self.db.commit()
-        self.db.refresh(device)
+        self.db.flush()
 
         return {
             "success": True,
@@ -2602,10 +3017,12 @@ class ToolExecutor:
 
         device_name = device.name
 
-        # 检查是否有关联的配置
-        wg_count = self.db.query(WireGuardConfig).filter(WireGuardConfig.device_id == device_id).count()
-        proxy_count = self.db.query(ProxyConfig).filter(ProxyConfig.device_id == device_id).count()
-        rule_count = self.db.query(RuleConfig).filter(RuleConfig.device_id == device_id).count()
+        # 检查是否有关联的配置（三个计数作为标量子查询，一次往返取回）
+        wg_count, proxy_count, rule_count = self.db.query(*(
+            select(func.count()).select_from(model).where(model.device_id == device_id)
+            .scalar_subquery()
+            for model in (WireGuardConfig, ProxyConfig, RuleConfig)
+        )).one()
 
         if wg_count + proxy_count + rule_count > 0:
             return {
@@ -2614,94 +3031,9 @@ class ToolExecutor:
             }
 
         self.db.delete(device)
-        self.db.commit()
 
         return {"success": True, "message": f"✅ 成功删除设备：{device_name}"}
 
-    def _handle_create_ruleset(self, args: dict[str, Any]) -> dict[str, Any]:
-        """创建规则集"""
-        name = args.get("name")
-        description = args.get("description", "")
-
-        if not name:
-            return {"success": False, "message": "❌ 缺少规则集名称"}
-
-        # 检查名称是否已存在
-        existing = self.db.query(RuleSet).filter(RuleSet.name == name).first()
-        if existing:
-            return {"success": False, "message": f"❌ 规则集 '{name}' 已存在"}
-
-        ruleset = RuleSet(
-            name=name,
-            description=description,
-        )
-        self.db.add(ruleset)
-        self.db.commit()
-        self.db.refresh(ruleset)
-
-        return {
-            "success": True,
-            "message": f"✅ 成功创建规则集：{name}",
-            "data": {
-                "id": ruleset.id,
-                "name": ruleset.name,
-                "description": ruleset.description,
-            }
-        }
-
-    def _handle_list_rulesets(self, args: dict[str, Any]) -> dict[str, Any]:
-        """获取规则集列表"""
-        keyword = args.get("keyword", "").lower()
-
-        rulesets = self.db.query(RuleSet).filter(RuleSet.is_active == True).all()
-
-        if keyword:
-            rulesets = [r for r in rulesets if keyword in r.name.lower() or keyword in (r.description or "").lower()]
-
-        if not rulesets:
-            return {"success": True, "message": "暂无规则集", "data": []}
-
-        lines = [f"📋 共 {len(rulesets)} 个规则集：", ""]
-        ruleset_info = []
-        for r in rulesets:
-            # 获取条目数量
-            item_count = self.db.query(RuleSetItem).filter(RuleSetItem.ruleset_id == r.id).count()
-            lines.append(f"#{r.id}  {r.name} ({item_count} 条)")
-            if r.description:
-                lines.append(f"    💬 {r.description}")
-            lines.append("")
-            ruleset_info.append({
-                "id": r.id,
-                "name": r.name,
-                "description": r.description,
-                "item_count": item_count,
-            })
-
-        return {
-            "success": True,
-            "message": "\n".join(lines),
-            "data": ruleset_info
-        }
-
-    def _handle_delete_ruleset(self, args: dict[str, Any]) -> dict[str, Any]:
-        """删除规则集"""
-        ruleset_id = args.get("ruleset_id")
-        if not ruleset_id:
-            return {"success": False, "message": "❌ 缺少 ruleset_id 参数"}
-
-        ruleset = self.db.query(RuleSet).filter(RuleSet.id == ruleset_id).first()
-        if not ruleset:
-            return {"success": False, "message": f"❌ 规则集 ID {ruleset_id} 不存在"}
-
-        ruleset_name = ruleset.name
-
-        # 删除所有条目（级联删除应该会自动处理，但显式删除更安全）
-        self.db.query(RuleSetItem).filter(RuleSetItem.ruleset_id == ruleset_id).delete()
-        self.db.delete(ruleset)
-        self.db.commit()
-
-        return {"success": True, "message": f"✅ 成功删除规则集：{ruleset_name}"}
-
     def _handle_add_ruleset_item(self, args: dict[str, Any]) -> dict[str, Any]:
         """向规则集添加条目"""
         ruleset_name = args.get("ruleset_name")
@@ -2712,36 +3044,36 @@ class ToolExecutor:
         if not all([ruleset_name, item_type, value]):
             return {"success": False, "message": "❌ 缺少必要参数: ruleset_name, item_type, value"}
 
-        # 查找规则集
-        ruleset = self.db.query(RuleSet).filter(RuleSet.name == ruleset_name).first()
-        if not ruleset:
-            return {"success": False, "message": f"❌ 规则集 '{ruleset_name}' 不存在"}
-
-        # 检查是否已存在相同条目
-        existing = self.db.query(RuleSetItem).filter(
-            RuleSetItem.ruleset_id == ruleset.id,
+        # 一次查询取回：规则集 ID、是否已存在相同条目、下一个排序值（MAX + 1）
+        duplicate = exists().where(
+            RuleSetItem.ruleset_id == RuleSet.id,
             RuleSetItem.item_type == item_type,
             RuleSetItem.value == value
-        ).first()
+        )
+        next_order = (
+            select(func.coalesce(func.max(RuleSetItem.sort_order), -1) + 1)
+            .where(RuleSetItem.ruleset_id == RuleSet.id)
+            .scalar_subquery()
+        )
+        ruleset = self.db.query(
+            RuleSet.id, duplicate.label("duplicate"), next_order.label("next_order")
+        ).filter(RuleSet.name == ruleset_name).first()
 
-        if existing:
+        if not ruleset:
+            return {"success": False, "message": f"❌ 规则集 '{ruleset_name}' 不存在"}
+        if ruleset.duplicate:
             return {"success": False, "message": f"❌ 条目 '{item_type}: {value}' 已存在于规则集中"}
 
-        # 获取当前最大排序值
-        max_order = self.db.query(RuleSetItem).filter(
-            RuleSetItem.ruleset_id == ruleset.id
-        ).count()
-
         item = RuleSetItem(
             ruleset_id=ruleset.id,
             item_type=item_type,
             value=value,
             comment=comment,
-            sort_order=max_order,
+            sort_order=ruleset.next_order,
         )
         self.db.add(item)
-        self.db.commit()
-        self.db.refresh(item)
+        # flush 即可拿到主键（支持 RETURNING 的数据库在 INSERT 中直接返回），无需再 refresh 查询一次
+        self.db.flush()
 
         return {
             "success": True,
@@ -2764,72 +3096,79 @@ class ToolExecutor:
             return {"success": False, "message": "❌ 缺少 sort_order 参数"}
 
         # 构建查询
-        query = self.db.query(RuleConfig).filter(RuleConfig.device_id.is_(None))
+        query = self.db.query(RuleConfig).filter(_RULE_GLOBAL_FILTER)
 
         # 应用过滤条件
         if keyword:
-            search_pattern = f"%{keyword}%"
+            search_pattern = _keyword_pattern(keyword)
             query = query.filter(
-                (RuleConfig.value.like(search_pattern)) |
-                (RuleConfig.policy.like(search_pattern)) |
-                (RuleConfig.comment.like(search_pattern))
+                (RuleConfig.value.like(search_pattern, escape="\\")) |
+                (RuleConfig.policy.like(search_pattern, escape="\\")) |
+                (RuleConfig.comment.like(search_pattern, escape="\\"))
             )
         if policy:
             query = query.filter(RuleConfig.policy == policy)
 
-        rules = query.all()
-
-        if not rules:
-            return {
-                "success": True,
-                "message": "未找到匹配的规则",
-                "data": {"affected_count": 0}
-            }
+        filter_desc = []
+        if keyword:
+            filter_desc.append(f"关键词: {keyword}")
+        if policy:
+            filter_desc.append(f"策略: {policy}")
+        not_found = {
+            "success": True,
+            "message": "未找到匹配的规则",
+            "data": {"affected_count": 0}
+        }
 
-        # 预览或执行
+        # 预览
         if dry_run:
-            filter_desc = []
-            if keyword:
-                filter_desc.append(f"关键词: {keyword}")
-            if policy:
-                filter_desc.append(f"策略: {policy}")
+            # 总数用 COUNT，预览只取前 20 条需要展示的列；
+            # value 只取前 41 个字符（展示截断到 40 个字符，多取 1 个用于判断是否需要省略号）
+            total = query.with_entities(func.count(RuleConfig.id)).scalar()
+            if not total:
+                return not_found
+            preview_rows = (
+                query.with_entities(
+                    RuleConfig.id,
+                    RuleConfig.rule_type,
+                    func.substr(RuleConfig.value, 1, 41).label("value"),
+                    RuleConfig.sort_order,
+                )
+                .limit(20)
+                .all()
+            )
+
             filter_info = f"（{', '.join(filter_desc)}）" if filter_desc else "（所有规则）"
 
-            lines = [f"🔍 预览：将 {len(rules)} 条规则的 sort_order 设置为 {sort_order} {filter_info}：", ""]
-            for r in rules[:20]:
-                value = r.value[:40] + "..." if len(r.value or "") > 40 else r.value
-                lines.append(f"  [ID:{r.id}] {r.rule_type}, {value} (当前: {r.sort_order})")
-            if len(rules) > 20:
-                lines.append(f"  ... 还有 {len(rules) - 20} 条规则")
+            lines = [f"🔍 预览：将 {total} 条规则的 sort_order 设置为 {sort_order} {filter_info}：", ""]
+            lines.extend(
+                f"  [ID:{r.id}] {r.rule_type}, {_truncate(r.value, 40)} (当前: {r.sort_order})"
+                for r in preview_rows
+            )
+            if total > 20:
+                lines.append(f"  ... 还有 {total - 20} 条规则")
 
             return {
                 "success": True,
                 "message": "\n".join(lines),
-                "data": {"affected_count": len(rules), "preview": True}
+                "data": {"affected_count": total, "preview": True}
             }
-        else:
-            # 执行批量更新
-            for rule in rules:
-                rule.sort_order = sort_order
-            self.db.commit()
-
-            filter_desc = []
-            if keyword:
-                filter_desc.append(f"关键词: {keyword}")
-            if policy:
-                filter_desc.append(f"策略: {policy}")
-            filter_info = f"（{', '.join(filter_desc)}）" if filter_desc else ""
 
-            return {
-                "success": True,
-                "message": f"✅ 成功将 {len(rules)} 条规则的 sort_order 设置为 {sort_order} {filter_info}",
-                "data": {"affected_count": len(rules)}
-            }
+        # 执行批量更新（单条 UPDATE 语句，不加载规则对象）
+        affected = query.update({RuleConfig.sort_order: sort_order}, synchronize_session=False)
+        if not affected:
+            return not_found
+
+        filter_info = f"（{', '.join(filter_desc)}）" if filter_desc else ""
+
+        return {
+            "success": True,
+            "message": f"✅ 成功将 {affected} 条规则的 sort_order 设置为 {sort_order} {filter_info}",
+            "data": {"affected_count": affected}
+        }
 
     def _handle_execute_sql(self, args: dict[str, Any]) -> dict[str, Any]:
         """执行任意 SQL 语句"""
-        from sqlalchemy import text
-
         sql = args.get("sql")
         params = args.get("params", {})
 
@@ -2839,15 +3178,19 @@ class ToolExecutor:
         sql = sql.strip()
 
         try:
-            # 判断是查询还是修改操作
-            sql_upper = sql.upper()
-            is_select = sql_upper.startswith("SELECT") or sql_upper.startswith("WITH")
+            # 判断是查询还是修改操作（只取开头 6 个字符比较，不复制整条 SQL）
+            head = sql[:6].lower()
+            is_select = head == "select" or head.startswith("with")
 
             if is_select:
-                # 执行查询
-                result = self.db.execute(text(sql), params)
-                rows = result.fetchall()
+                # 执行查询：服务端游标流式读取，只缓存展示需要的前 50 行（多取 1 行判断是否还有更多）
+                result = self.db.execute(text(sql).execution_options(stream_results=True), params)
+                rows = result.fetchmany(51)
                 columns = result.keys() if hasattr(result, 'keys') else []
+                # 取够后立即关闭游标，剩余行不再读取；超过 50 行时总数未知，total_count 为 None
+                result.close()
+                truncated = len(rows) > 50
+                total_count = None if truncated else len(rows)
 
                 if not rows:
                     return {
@@ -2858,7 +3201,7 @@ class ToolExecutor:
 
                 # 格式化输出
                 columns_list = list(columns)
-                lines = [f"📊 查询结果（{len(rows)} 行）：", ""]
+                lines = [f"📊 查询结果（{'超过 50' if truncated else total_count} 行）：", ""]
 
                 # 表头
                 if columns_list:
@@ -2874,8 +3217,8 @@ class ToolExecutor:
                     row_str = " | ".join(str(v)[:30] for v in row)
                     lines.append(row_str)
 
-                if len(rows) > 50:
-                    lines.append(f"... 还有 {len(rows) - 50} 行未显示")
+                if truncated:
+                    lines.append("... 还有更多行未显示")
 
                 return {
                     "success": True,
@@ -2883,13 +3226,13 @@ class ToolExecutor:
                     "data": {
                         "columns": columns_list,
                         "rows": data_list,
-                        "total_count": len(rows)
+                        "total_count": total_count,
+                        "truncated": truncated
                     }
                 }
             else:
                 # 执行修改操作
                 result = self.db.execute(text(sql), params)
-                self.db.commit()
 
                 affected = result.rowcount if hasattr(result, 'rowcount') else 0
 
@@ -2905,3 +3248,11 @@ class ToolExecutor:
                 "success": False,
                 "message": f"❌ SQL 执行失败: {str(e)}"
             }
+
+
+# 工具名 → 处理函数，类定义完成后一次性构建，execute 直接查表分发
+_TOOL_HANDLERS: dict[str, Callable[[ToolExecutor, dict[str, Any]], dict[str, Any]]] = {
+    name.removeprefix("_handle_"): handler
+    for name, handler in vars(ToolExecutor).items()
+    if name.startswith("_handle_")
+}
@@ -1,4 +1,6 @@
 """AI 服务工厂模块"""
+from functools import lru_cache
+
 from app.schemas.ai_assistant import AIEngine
 from .services import BaseAIService, ZhipuAIService, GeminiAIService
 
@@ -11,11 +13,24 @@ def get_ai_service(engine: AIEngine) -> BaseAIService:
         api_key = settings.zhipu_api_key
         if not api_key:
             raise ValueError("未配置 zhipu_api_key，请在 config.toml 中配置")
-        return ZhipuAIService(api_key, settings.zhipu_model)
+        return _cached_service(engine, api_key, settings.zhipu_model)
     elif engine == AIEngine.GEMINI:
         api_key = settings.gemini_api_key
         if not api_key:
             raise ValueError("未配置 gemini_api_key，请在 config.toml 中配置")
-        return GeminiAIService(api_key, settings.gemini_model, settings.gemini_proxy_url)
+        return _cached_service(engine, api_key, settings.gemini_model, settings.gemini_proxy_url)
     else:
         raise ValueError(f"不支持的 AI 引擎: {engine}")
+
+
+@lru_cache(maxsize=8)
+def _cached_service(
+    engine: AIEngine, api_key: str, model: str, proxy_url: str | None = None
+) -> BaseAIService:
+    """按 (引擎, API Key, 模型, 代理) 缓存服务实例，复用底层 HTTP 客户端与连接池
+
+    配置变更后参数不同，会自动创建新的实例。
+    """
+    if engine == AIEngine.ZHIPU:
+        return ZhipuAIService(api_key, model)
+    return GeminiAIService(api_key, model, proxy_url)
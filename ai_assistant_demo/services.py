@@ -1,6 +1,7 @@
 """AI 服务类模块"""
 import json
 from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
 
 from loguru import logger
 
@@ -28,6 +29,59 @@ class BaseAIService(ABC):
         pass
 
 
+def _record_tool_result(
+    name: str,
+    arguments: dict,
+    result: dict,
+    tool_calls_result: list[ToolCallResult]
+) -> str:
+    """记录一次工具调用结果，返回追加到回复内容中的结果文本"""
+    tool_calls_result.append(ToolCallResult(
+        name=name,
+        arguments=arguments,
+        result=result
+    ))
+
+    if result.get("success"):
+        return f"\n\n✅ {result.get('message', '操作成功')}"
+    return f"\n\n❌ {result.get('message', '操作失败')}"
+
+
+def _run_tool_call(
+    tool_executor: ToolExecutor,
+    name: str,
+    arguments: dict,
+    tool_calls_result: list[ToolCallResult]
+) -> str:
+    """执行一次工具调用，记录调用结果，返回追加到回复内容中的结果文本"""
+    result = tool_executor.execute(name, arguments)
+    return _record_tool_result(name, arguments, result, tool_calls_result)
+
+
+_MAX_TOOL_WORKERS = 4  # 并发执行只读工具的最大线程数
+
+
+def _run_read_only_calls(
+    tool_executor: ToolExecutor,
+    calls: list[tuple[str, dict]],
+    tool_calls_result: list[ToolCallResult]
+) -> list[str]:
+    """并发执行一组只读工具调用（各自使用独立的数据库会话），按调用顺序记录结果
+
+    无法创建独立会话时退回到在当前会话中顺序执行。
+    """
+    run = tool_executor.isolated_runner() if len(calls) > 1 else None
+    if run is None:
+        return [_run_tool_call(tool_executor, name, arguments, tool_calls_result) for name, arguments in calls]
+
+    with ThreadPoolExecutor(max_workers=min(_MAX_TOOL_WORKERS, len(calls))) as pool:
+        results = list(pool.map(lambda call: run(*call), calls))
+    return [
+        _record_tool_result(name, arguments, result, tool_calls_result)
+        for (name, arguments), result in zip(calls, results, strict=True)
+    ]
+
+
 # ============ 智谱 AI 服务 ============
 
 class ZhipuAIService(BaseAIService):
@@ -65,40 +119,58 @@ class ZhipuAIService(BaseAIService):
         messages.append({"role": "user", "content": message})
 
         try:
+            # 流式接收：每个工具调用的参数接收完整后立即执行，与模型继续生成后续内容重叠
             response = self.client.chat.completions.create(
                 model=self.model,
                 messages=messages,
                 tools=TOOLS_DEFINITION,
-                stream=False,
+                stream=True,
             )
 
-            choice = response.choices[0]
-            content = choice.message.content or ""
+            text_parts: list[str] = []
+            result_parts: list[str] = []
             tool_calls_result: list[ToolCallResult] = []
-
-            # 处理工具调用
-            if choice.message.tool_calls:
-                for tool_call in choice.message.tool_calls:
-                    func = tool_call.function
+            # 正在接收的工具调用：[序号, 名称, 参数片段列表]
+            pending = None
+
+            def flush_pending():
+                _, name, fragments = pending
+                if len(fragments) == 1 and isinstance(fragments[0], dict):
+                    arguments = fragments[0]
+                else:
                     try:
-                        arguments = json.loads(func.arguments) if isinstance(func.arguments, str) else func.arguments
+                        arguments = json.loads("".join(fragments))
                     except json.JSONDecodeError:
                         arguments = {}
+                result_parts.append(_run_tool_call(tool_executor, name, arguments, tool_calls_result))
+
+            for chunk in response:
+                if not chunk.choices:
+                    continue
+                delta = chunk.choices[0].delta
+                if delta.content:
+                    text_parts.append(delta.content)
+
+                # 处理工具调用
+                for tool_call in delta.tool_calls or []:
+                    if pending is None or tool_call.index != pending[0]:
+                        # 出现新的工具调用，说明上一个已接收完整
+                        if pending is not None:
+                            flush_pending()
+                        pending = [tool_call.index, "", []]
+                    func = tool_call.function
+                    if func is None:
+                        continue
+                    if func.name:
+                        pending[1] = func.name
+                    if func.arguments:
+                        pending[2].append(func.arguments)
 
-                    result = tool_executor.execute(func.name, arguments)
-                    tool_calls_result.append(ToolCallResult(
-                        name=func.name,
-                        arguments=arguments,
-                        result=result
-                    ))
-
-                    # 将工具结果添加到内容中
-                    if result.get("success"):
-                        content += f"\n\n✅ {result.get('message', '操作成功')}"
-                    else:
-                        content += f"\n\n❌ {result.get('message', '操作失败')}"
+            if pending is not None:
+                flush_pending()
 
-            return content, tool_calls_result
+            # 与非流式时一致：先是模型回复，再依次追加各工具的执行结果
+            return "".join(text_parts) + "".join(result_parts), tool_calls_result
 
         except Exception as e:
             logger.error(f"智谱 AI 调用失败: {e}")
@@ -107,30 +179,42 @@ class ZhipuAIService(BaseAIService):
 
 # ============ Gemini 服务 ============
 
-def _convert_proto_value(value):
-    """递归转换 protobuf struct 值为 Python 原生类型"""
-    logger.info(f"_convert_proto_value 输入: type={type(value)}, value={value}")
+# protobuf 类型只在模块加载时导入一次；未安装时用空元组，isinstance 判断恒为 False
+try:
+    from google.protobuf.json_format import MessageToDict
+    from google.protobuf.struct_pb2 import ListValue, Struct
+except ImportError:
+    MessageToDict = None
+    Struct = ListValue = ()
+
+_SCALAR_TYPES = (str, int, float, bool)
+_MAX_PROTO_DEPTH = 32  # 函数调用参数的最大嵌套层数
 
-    if value is None:
-        return None
-    elif isinstance(value, (str, int, float, bool)):
+
+def _convert_proto_value(value, depth: int = 0):
+    """递归转换 protobuf struct 值为 Python 原生类型
+
+    嵌套超过 _MAX_PROTO_DEPTH 层时不再展开，直接转为字符串，避免异常输入导致栈溢出。
+    """
+    # 快速路径：原生类型（最常见）先判断
+    if value is None or isinstance(value, _SCALAR_TYPES):
         return value
-    elif isinstance(value, dict):
+    if depth >= _MAX_PROTO_DEPTH:
+        logger.warning(f"参数嵌套超过 {_MAX_PROTO_DEPTH} 层，按字符串处理")
+        return str(value)
+    depth += 1
+    if isinstance(value, dict):
         # 已经是字典，递归处理值
-        return {k: _convert_proto_value(v) for k, v in value.items()}
-    elif isinstance(value, list):
+        return {k: _convert_proto_value(v, depth) for k, v in value.items()}
+    if isinstance(value, list):
         # 已经是列表，递归处理元素
-        return [_convert_proto_value(v) for v in value]
+        return [_convert_proto_value(v, depth) for v in value]
 
-    # 尝试导入 protobuf 类型
-    try:
-        from google.protobuf.struct_pb2 import Struct, ListValue
-        if isinstance(value, Struct):
-            return {k: _convert_proto_value(v) for k, v in value.fields.items()}
-        elif isinstance(value, ListValue):
-            return [_convert_proto_value(v) for v in value.values]
-    except ImportError:
-        pass
+    # protobuf Struct / ListValue
+    if isinstance(value, Struct):
+        return {k: _convert_proto_value(v, depth) for k, v in value.fields.items()}
+    if isinstance(value, ListValue):
+        return [_convert_proto_value(v, depth) for v in value.values]
 
     # 处理 protobuf Value 类型
     if hasattr(value, 'HasField'):
@@ -142,9 +226,9 @@ def _convert_proto_value(value):
             elif value.HasField('bool_value'):
                 return value.bool_value
             elif value.HasField('struct_value'):
-                return _convert_proto_value(value.struct_value)
+                return _convert_proto_value(value.struct_value, depth)
             elif value.HasField('list_value'):
-                return _convert_proto_value(value.list_value)
+                return _convert_proto_value(value.list_value, depth)
             elif value.HasField('null_value'):
                 return None
         except Exception as e:
@@ -152,39 +236,49 @@ def _convert_proto_value(value):
 
     # 处理 MapComposite (类似字典的 protobuf 对象)
     if hasattr(value, 'keys') and callable(value.keys):
-        logger.info(f"检测到类字典对象，keys: {list(value.keys())}")
-        result = {}
-        for k in value.keys():
-            logger.info(f"处理 key: {k}")
-            result[k] = _convert_proto_value(value[k])
-        return result
+        return {k: _convert_proto_value(value[k], depth) for k in value.keys()}
 
     # 处理可迭代对象 (类似列表的 protobuf 对象)
     if hasattr(value, '__iter__') and not isinstance(value, (str, bytes)):
         try:
-            logger.info(f"尝试作为可迭代对象处理")
-            return [_convert_proto_value(v) for v in value]
+            return [_convert_proto_value(v, depth) for v in value]
         except Exception as e:
             logger.warning(f"迭代失败: {e}")
 
     # 最后尝试直接转换
     try:
-        result = dict(value)
-        logger.info(f"dict() 转换成功: {result}")
-        return result
+        return dict(value)
     except (TypeError, ValueError) as e:
         logger.warning(f"dict() 转换失败: {e}, 返回字符串")
         return str(value)
 
 
+def _function_call_args(args) -> dict:
+    """转换 Gemini 函数调用参数为 Python 字典
+
+    新版 SDK 直接返回字典；protobuf 消息交给 C 实现的 MessageToDict 一次转换，
+    其余情况（及转换失败时）回退到 _convert_proto_value 逐层递归。
+    """
+    if isinstance(args, dict) or MessageToDict is None:
+        return _convert_proto_value(args)
+    try:
+        return MessageToDict(getattr(args, "_pb", args), preserving_proto_field_name=True)
+    except Exception:
+        return _convert_proto_value(args)
+
+
 class GeminiAIService(BaseAIService):
     """Google Gemini 服务 (使用新版 google.genai SDK)"""
 
     def __init__(self, api_key: str, model: str = "gemini-2.0-flash", proxy_url: str | None = None):
         super().__init__(api_key, model)
+        # 可选依赖仍在构造时导入（服务实例由工厂缓存复用，只导入一次）
         from google import genai
+        from google.genai import types
         import httpx
 
+        self._types = types
+
         http_options = {}
         if proxy_url:
             # 创建带代理的 httpx 客户端
@@ -217,6 +311,11 @@ class GeminiAIService(BaseAIService):
 
         self.client = genai.Client(api_key=api_key, http_options=http_options)
 
+        # 工具定义不随对话变化，只构建一次
+        self._tool = types.Tool(function_declarations=GEMINI_TOOLS_DEFINITION)
+        # 最近一次使用的 (系统提示词, GenerateContentConfig)，提示词未变化时直接复用
+        self._config_cache = None
+
     def chat(
         self,
         message: str,
@@ -224,7 +323,7 @@ class GeminiAIService(BaseAIService):
         tool_executor: ToolExecutor
     ) -> tuple[str, list[ToolCallResult]]:
         """发送消息并获取响应"""
-        from google.genai import types
+        types = self._types
 
         logger.info("Gemini chat 开始")
 
@@ -232,24 +331,15 @@ class GeminiAIService(BaseAIService):
         system_instruction = create_system_prompt(tool_executor)
         logger.info("系统提示词生成完成")
 
-        # 构建工具定义
-        logger.info(f"GEMINI_TOOLS_DEFINITION 数量: {len(GEMINI_TOOLS_DEFINITION)}")
-        try:
-            tools = types.Tool(function_declarations=GEMINI_TOOLS_DEFINITION)
-            logger.info("Tool 对象创建成功")
-        except Exception as e:
-            logger.error(f"Tool 对象创建失败: {e}")
-            raise
-
-        try:
+        cached = self._config_cache
+        if cached is not None and cached[0] == system_instruction:
+            config = cached[1]
+        else:
             config = types.GenerateContentConfig(
-                tools=[tools],
+                tools=[self._tool],
                 system_instruction=system_instruction
             )
-            logger.info("GenerateContentConfig 创建成功")
-        except Exception as e:
-            logger.error(f"GenerateContentConfig 创建失败: {e}")
-            raise
+            self._config_cache = (system_instruction, config)
 
         # 构建消息内容
         contents = []
@@ -263,46 +353,62 @@ class GeminiAIService(BaseAIService):
 
         try:
             logger.info("开始调用 Gemini API...")
-            response = self.client.models.generate_content(
+            # 流式接收：函数调用片段到达即执行，与模型继续生成后续内容重叠
+            response = self.client.models.generate_content_stream(
                 model=self.model,
                 contents=contents,
                 config=config,
             )
-            logger.info("Gemini API 调用成功")
 
-            content = ""
+            content_parts: list[str] = []
             tool_calls_result: list[ToolCallResult] = []
 
+            # 同一响应块中的只读工具调用并发执行：先占位，执行完成后按原顺序填入结果
+            pending_reads: list[tuple[int, str, dict]] = []
+
+            def flush_reads():
+                if not pending_reads:
+                    return
+                lines = _run_read_only_calls(
+                    tool_executor, [(name, arguments) for _, name, arguments in pending_reads], tool_calls_result
+                )
+                for (index, _, _), line in zip(pending_reads, lines, strict=True):
+                    content_parts[index] = line
+                pending_reads.clear()
+
             # 处理响应
-            for part in response.candidates[0].content.parts:
-                if part.text:
-                    content += part.text
-                elif part.function_call:
-                    func_call = part.function_call
-                    # 调试日志：查看原始参数类型和内容
-                    logger.info(f"Gemini 工具调用: {func_call.name}")
-                    logger.info(f"原始 args 类型: {type(func_call.args)}")
-                    logger.info(f"原始 args 内容: {func_call.args}")
-
-                    # 使用递归转换函数处理嵌套的 protobuf 结构
-                    arguments = _convert_proto_value(func_call.args) if func_call.args else {}
-                    logger.info(f"转换后 arguments 类型: {type(arguments)}")
-                    logger.info(f"转换后 arguments 内容: {arguments}")
-
-                    result = tool_executor.execute(func_call.name, arguments)
-                    tool_calls_result.append(ToolCallResult(
-                        name=func_call.name,
-                        arguments=arguments,
-                        result=result
-                    ))
-
-                    # 将工具结果添加到内容中
-                    if result.get("success"):
-                        content += f"\n\n✅ {result.get('message', '操作成功')}"
-                    else:
-                        content += f"\n\n❌ {result.get('message', '操作失败')}"
-
-            return content, tool_calls_result
+            for chunk in response:
+                if not chunk.candidates or not chunk.candidates[0].content:
+                    continue
+                for part in chunk.candidates[0].content.parts or []:
+                    if part.text:
+                        content_parts.append(part.text)
+                    elif part.function_call:
+                        func_call = part.function_call
+                        # 调试日志：查看原始参数类型和内容
+                        logger.info(f"Gemini 工具调用: {func_call.name}")
+                        logger.info(f"原始 args 类型: {type(func_call.args)}")
+                        logger.info(f"原始 args 内容: {func_call.args}")
+
+                        # 转换可能嵌套的 protobuf 结构
+                        arguments = _function_call_args(func_call.args) if func_call.args else {}
+                        logger.info(f"转换后 arguments 类型: {type(arguments)}")
+                        logger.info(f"转换后 arguments 内容: {arguments}")
+
+                        if tool_executor.is_read_only(func_call.name):
+                            pending_reads.append((len(content_parts), func_call.name, arguments))
+                            content_parts.append("")
+                        else:
+                            # 修改类工具按顺序执行：先完成之前的只读调用
+                            flush_reads()
+                            # 将工具结果添加到内容中
+                            content_parts.append(
+                                _run_tool_call(tool_executor, func_call.name, arguments, tool_calls_result)
+                            )
+                flush_reads()
+            logger.info("Gemini API 调用成功")
+
+            return "".join(content_parts), tool_calls_result
 
         except Exception as e:
             logger.error(f"Gemini 调用失败: {e}")
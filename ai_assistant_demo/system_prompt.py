@@ -96,7 +96,10 @@ def create_system_prompt(tool_executor: "ToolExecutor") -> str:
     try:
         config_context = tool_executor.get_config_context()
         logger.info("config_context 获取成功")
-        result = SYSTEM_PROMPT_TEMPLATE.format(config_context=config_context)
+        # 配置未变化时复用上次渲染的提示词
+        result = tool_executor.cached_prompt(
+            config_context, lambda context: SYSTEM_PROMPT_TEMPLATE.format(config_context=context)
+        )
         logger.info("系统提示词格式化成功")
         return result
     except Exception as e:
@@ -3,6 +3,34 @@
 定义 AI 可调用的工具列表，支持 OpenAI 和 Gemini 格式。
 """
 
+# ============ 公共参数 ============
+# 多个工具共用的参数定义，引用同一个对象，避免重复构造
+
+_KEYWORD_PROP = {
+    "type": "string",
+    "description": "搜索关键词（可选）"
+}
+
+_NEW_DESCRIPTION_PROP = {
+    "type": "string",
+    "description": "新的描述（可选）"
+}
+
+_RULESET_ID_PROP = {
+    "type": "integer",
+    "description": "规则集 ID"
+}
+
+_DRY_RUN_PROP = {
+    "type": "boolean",
+    "description": "是否只预览而不实际修改（默认 false）",
+    "default": False
+}
+
+# 多个工具共用的枚举值
+_GROUP_TYPES = ["select", "url-test", "fallback", "load-balance", "smart"]
+_RULESET_ITEM_TYPES = ["IP-CIDR", "IP-CIDR6", "DOMAIN", "DOMAIN-SUFFIX", "DOMAIN-KEYWORD"]
+
 # ============ 工具定义 ============
 
 TOOLS_DEFINITION = [
@@ -71,6 +99,12 @@ rule_type="AND", value="((NOT,((SUBNET,ROUTER:10.21.21.254))), (IP-CIDR,10.21.21
                         "type": "integer",
                         "description": "返回的规则数量上限，默认 20",
                         "default": 20
+                    },
+                    "format": {
+                        "type": "string",
+                        "enum": ["both", "data", "text"],
+                        "description": "返回格式：data 仅结构化数据，text 仅文本，both 两者都返回（默认）",
+                        "default": "both"
                     }
                 }
             }
@@ -147,17 +181,13 @@ rule_type="AND", value="((NOT,((SUBNET,ROUTER:10.21.21.254))), (IP-CIDR,10.21.21
                     },
                     "keyword": {
                         "type": "string",
-                        "description": "搜索关键词，只更新匹配的规则（可选，不提供则更新所有规则）"
+                        "description": "搜索关键词，只更新匹配的规则（可选，不提供则更新所有规则）。默认包含匹配；首尾的 * 表示锚定，如 'google*' 表示以 google 开头、'*.google.com' 表示以 .google.com 结尾，其余字符按字面匹配"
                     },
                     "policy": {
                         "type": "string",
                         "description": "策略名称，只更新使用该策略的规则（可选）"
                     },
-                    "dry_run": {
-                        "type": "boolean",
-                        "description": "是否只预览而不实际修改（默认 false）",
-                        "default": False
-                    }
+                    "dry_run": _DRY_RUN_PROP
                 },
                 "required": ["sort_order"]
             }
@@ -171,10 +201,7 @@ rule_type="AND", value="((NOT,((SUBNET,ROUTER:10.21.21.254))), (IP-CIDR,10.21.21
             "parameters": {
                 "type": "object",
                 "properties": {
-                    "keyword": {
-                        "type": "string",
-                        "description": "搜索关键词（可选）"
-                    }
+                    "keyword": _KEYWORD_PROP
                 }
             }
         }
@@ -198,10 +225,7 @@ rule_type="AND", value="((NOT,((SUBNET,ROUTER:10.21.21.254))), (IP-CIDR,10.21.21
             "parameters": {
                 "type": "object",
                 "properties": {
-                    "keyword": {
-                        "type": "string",
-                        "description": "搜索关键词（可选）"
-                    }
+                    "keyword": _KEYWORD_PROP
                 }
             }
         }
@@ -256,10 +280,7 @@ rule_type="AND", value="((NOT,((SUBNET,ROUTER:10.21.21.254))), (IP-CIDR,10.21.21
             "parameters": {
                 "type": "object",
                 "properties": {
-                    "keyword": {
-                        "type": "string",
-                        "description": "搜索关键词（可选）"
-                    }
+                    "keyword": _KEYWORD_PROP
                 }
             }
         }
@@ -301,11 +322,7 @@ rule_type="AND", value="((NOT,((SUBNET,ROUTER:10.21.21.254))), (IP-CIDR,10.21.21
                         "type": "string",
                         "description": "新的策略名称"
                     },
-                    "dry_run": {
-                        "type": "boolean",
-                        "description": "是否只预览而不实际修改（默认 false）",
-                        "default": False
-                    }
+                    "dry_run": _DRY_RUN_PROP
                 },
                 "required": ["old_policy", "new_policy"]
             }
@@ -325,7 +342,7 @@ rule_type="AND", value="((NOT,((SUBNET,ROUTER:10.21.21.254))), (IP-CIDR,10.21.21
                     },
                     "group_type": {
                         "type": "string",
-                        "enum": ["select", "url-test", "fallback", "load-balance", "smart"],
+                        "enum": _GROUP_TYPES,
                         "description": "策略组类型"
                     },
                     "members": {
@@ -360,7 +377,7 @@ rule_type="AND", value="((NOT,((SUBNET,ROUTER:10.21.21.254))), (IP-CIDR,10.21.21
                     },
                     "group_type": {
                         "type": "string",
-                        "enum": ["select", "url-test", "fallback", "load-balance", "smart"],
+                        "enum": _GROUP_TYPES,
                         "description": "新的策略组类型（可选）"
                     },
                     "members": {
@@ -368,10 +385,7 @@ rule_type="AND", value="((NOT,((SUBNET,ROUTER:10.21.21.254))), (IP-CIDR,10.21.21
                         "items": {"type": "string"},
                         "description": "新的成员列表（可选）"
                     },
-                    "description": {
-                        "type": "string",
-                        "description": "新的描述（可选）"
-                    }
+                    "description": _NEW_DESCRIPTION_PROP
                 },
                 "required": ["group_id"]
             }
@@ -460,10 +474,7 @@ rule_type="AND", value="((NOT,((SUBNET,ROUTER:10.21.21.254))), (IP-CIDR,10.21.21
                         "type": "object",
                         "description": "新的协议参数（可选）"
                     },
-                    "description": {
-                        "type": "string",
-                        "description": "新的描述（可选）"
-                    }
+                    "description": _NEW_DESCRIPTION_PROP
                 },
                 "required": ["proxy_id"]
             }
@@ -690,10 +701,7 @@ rule_type="AND", value="((NOT,((SUBNET,ROUTER:10.21.21.254))), (IP-CIDR,10.21.21
                         "type": "integer",
                         "description": "新的保持连接间隔（可选）"
                     },
-                    "description": {
-                        "type": "string",
-                        "description": "新的描述（可选）"
-                    }
+                    "description": _NEW_DESCRIPTION_PROP
                 },
                 "required": ["service_id"]
             }
@@ -814,10 +822,7 @@ rule_type="AND", value="((NOT,((SUBNET,ROUTER:10.21.21.254))), (IP-CIDR,10.21.21
                         "type": "integer",
                         "description": "新的 MTU 值（可选）"
                     },
-                    "description": {
-                        "type": "string",
-                        "description": "新的描述（可选）"
-                    }
+                    "description": _NEW_DESCRIPTION_PROP
                 },
                 "required": ["config_id"]
             }
@@ -879,13 +884,17 @@ rule_type="AND", value="((NOT,((SUBNET,ROUTER:10.21.21.254))), (IP-CIDR,10.21.21
                         "type": "integer",
                         "description": "要回滚到的版本记录 ID（从 list_config_history 获取）"
                     },
+                    "version_ids": {
+                        "type": "array",
+                        "items": {"type": "integer"},
+                        "description": "批量回滚的版本记录 ID 列表（可选，提供时忽略 version_id）"
+                    },
                     "confirm": {
                         "type": "boolean",
                         "description": "确认执行回滚操作（默认 false，需明确设置为 true）",
                         "default": False
                     }
-                },
-                "required": ["version_id"]
+                }
             }
         }
     },
@@ -914,7 +923,7 @@ rule_type="AND", value="((NOT,((SUBNET,ROUTER:10.21.21.254))), (IP-CIDR,10.21.21
                             "properties": {
                                 "item_type": {
                                     "type": "string",
-                                    "enum": ["IP-CIDR", "IP-CIDR6", "DOMAIN", "DOMAIN-SUFFIX", "DOMAIN-KEYWORD"],
+                                    "enum": _RULESET_ITEM_TYPES,
                                     "description": "条目类型"
                                 },
                                 "value": {
@@ -945,6 +954,10 @@ rule_type="AND", value="((NOT,((SUBNET,ROUTER:10.21.21.254))), (IP-CIDR,10.21.21
                     "keyword": {
                         "type": "string",
                         "description": "搜索关键词，匹配名称或描述（可选）"
+                    },
+                    "active_only": {
+                        "type": "boolean",
+                        "description": "是否只返回启用的规则集（可选，默认 false）"
                     }
                 }
             }
@@ -958,10 +971,7 @@ rule_type="AND", value="((NOT,((SUBNET,ROUTER:10.21.21.254))), (IP-CIDR,10.21.21
             "parameters": {
                 "type": "object",
                 "properties": {
-                    "ruleset_id": {
-                        "type": "integer",
-                        "description": "规则集 ID"
-                    },
+                    "ruleset_id": _RULESET_ID_PROP,
                     "name": {
                         "type": "string",
                         "description": "规则集名称（可通过名称查找）"
@@ -978,18 +988,12 @@ rule_type="AND", value="((NOT,((SUBNET,ROUTER:10.21.21.254))), (IP-CIDR,10.21.21
             "parameters": {
                 "type": "object",
                 "properties": {
-                    "ruleset_id": {
-                        "type": "integer",
-                        "description": "规则集 ID"
-                    },
+                    "ruleset_id": _RULESET_ID_PROP,
                     "name": {
                         "type": "string",
                         "description": "新的规则集名称（可选）"
                     },
-                    "description": {
-                        "type": "string",
-                        "description": "新的描述（可选）"
-                    },
+                    "description": _NEW_DESCRIPTION_PROP,
                     "is_active": {
                         "type": "boolean",
                         "description": "是否启用（可选）"
@@ -1007,10 +1011,7 @@ rule_type="AND", value="((NOT,((SUBNET,ROUTER:10.21.21.254))), (IP-CIDR,10.21.21
             "parameters": {
                 "type": "object",
                 "properties": {
-                    "ruleset_id": {
-                        "type": "integer",
-                        "description": "规则集 ID"
-                    }
+                    "ruleset_id": _RULESET_ID_PROP
                 },
                 "required": ["ruleset_id"]
             }
@@ -1040,7 +1041,7 @@ rule_type="AND", value="((NOT,((SUBNET,ROUTER:10.21.21.254))), (IP-CIDR,10.21.21
                             "properties": {
                                 "item_type": {
                                     "type": "string",
-                                    "enum": ["IP-CIDR", "IP-CIDR6", "DOMAIN", "DOMAIN-SUFFIX", "DOMAIN-KEYWORD"],
+                                    "enum": _RULESET_ITEM_TYPES,
                                     "description": "条目类型"
                                 },
                                 "value": {
@@ -1068,10 +1069,7 @@ rule_type="AND", value="((NOT,((SUBNET,ROUTER:10.21.21.254))), (IP-CIDR,10.21.21
             "parameters": {
                 "type": "object",
                 "properties": {
-                    "ruleset_id": {
-                        "type": "integer",
-                        "description": "规则集 ID"
-                    },
+                    "ruleset_id": _RULESET_ID_PROP,
                     "item_id": {
                         "type": "integer",
                         "description": "条目 ID"
@@ -1202,10 +1200,7 @@ rule_type="AND", value="((NOT,((SUBNET,ROUTER:10.21.21.254))), (IP-CIDR,10.21.21
                         "type": "string",
                         "description": "新的目标 IP 或域名（可选）"
                     },
-                    "description": {
-                        "type": "string",
-                        "description": "新的描述（可选）"
-                    }
+                    "description": _NEW_DESCRIPTION_PROP
                 },
                 "required": ["host_id"]
             }
@@ -1236,10 +1231,7 @@ rule_type="AND", value="((NOT,((SUBNET,ROUTER:10.21.21.254))), (IP-CIDR,10.21.21
             "parameters": {
                 "type": "object",
                 "properties": {
-                    "keyword": {
-                        "type": "string",
-                        "description": "搜索关键词（可选）"
-                    }
+                    "keyword": _KEYWORD_PROP
                 }
             }
         }